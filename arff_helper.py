@@ -18,7 +18,8 @@ class ArffHelper(object):
         @RELATION: a string with the name of the data set.
         @ATTRIBUTES: a list of attributes representing names of data columns
                      followed by the types of data. The available data types
-                     are 'NUMERIC', 'REAL', 'INTEGER' or a list of string.
+                     are 'NUMERIC', 'REAL', 'INTEGER' or a list of string. Values of a categorical
+                     attribute (a list of strings) are stored as integer codes, i.e. their position in the list.
         @DESCRIPTION: a string with the description of the data set.
         @DATA: a list of data instances. The data should follow the order that
                the attributes were presented.
@@ -80,6 +81,9 @@ class ArffHelper(object):
         if type(def_value) == str and def_value not in dtype:
             warnings.warn("The type of the default value is not the same as type of column data"
                           " or the default value is not in the list (date type provided is {})".format(name))
+        # categorical values are stored as their code
+        elif type(def_value) == str:
+            def_value = dtype.index(def_value)
 
         if name in arr.dtype.names:
             raise ValueError('Array @arr already has a field {}'.format(name))
@@ -125,9 +129,50 @@ class ArffHelper(object):
 
         """
         d = np.dtype([(str(at[0]), ArffHelper._convert_dtype_to_numpy(at[1])) for at in obj['attributes']])
-        obj['data'] = np.array([tuple(item) for item in obj['data']], dtype=d)
+        data = obj['data']
+        if isinstance(data, np.ndarray) and data.dtype.names is not None:
+            # already structured, only the field types may differ
+            obj['data'] = data.astype(d)
+            return obj
+
+        # fill the structured array column by column instead of converting every row to a tuple
+        if isinstance(data, np.ndarray) and data.ndim == 2:
+            columns = data.T
+        else:
+            columns = list(zip(*data)) if len(data) > 0 else [()] * len(d.names)
+        structured = np.empty(len(data), dtype=d)
+        for (name, data_type), column in zip(obj['attributes'], columns):
+            if type(data_type) == tuple:
+                column = ArffHelper.encode_categorical(column, data_type)
+            structured[str(name)] = column
+        obj['data'] = structured
         return obj
 
+    @staticmethod
+    def encode_categorical(values, data_type):
+        """
+        Convert the values of a categorical attribute into their integer codes (position in @data_type).
+        Values that are already codes are returned unchanged.
+
+        :param values: array or list of values.
+        :param data_type: tuple of strings, the categorical attribute type.
+        :return: numpy array of codes.
+
+        """
+        values = np.asarray(values)
+        if values.dtype.kind not in 'US':
+            return values
+
+        names = np.array(data_type)
+        order = np.argsort(names)
+        positions = np.minimum(np.searchsorted(names, values, sorter=order), len(names) - 1)
+        codes = order[positions]
+        unknown = names[codes] != values
+        if np.any(unknown):
+            raise ValueError('Values {} are not in the categorical attribute type {}'.format(
+                             sorted(set(values[unknown].tolist())), data_type))
+        return codes.astype(ArffHelper._convert_dtype_to_numpy(data_type))
+
     @staticmethod
     def _convert_dtype_to_numpy(data_type):
         """
@@ -136,17 +181,17 @@ class ArffHelper(object):
         :param data_type: input data_type, string.
                           Available data types:
                           'NUMERIC', 'REAL', 'INTEGER' or a tuple of string (then it's a categorical attribute).
-        :return: converted numpy.dtype from input data_type.
+        :return: converted numpy.dtype from input data_type, int8 codes for categorical attributes (int32 if they have
+                 more than 127 values).
 
         """
         if data_type in ArffHelper._ATTRIBUTES_TYPE.keys():
             return ArffHelper._ATTRIBUTES_TYPE[data_type]
         else:
             if type(data_type) == tuple:
-                max_length = max(map(len, data_type))
+                return np.int8 if len(data_type) <= np.iinfo(np.int8).max else np.int32
             else:
                 raise ValueError("Wrong data type in attributes. "
                                  "It should be a list of strings or one of the data types in {}".format(
                                   ', '.join(ArffHelper._ATTRIBUTES_TYPE.keys())))
 
-            return '<U{}'.format(max_length)
@@ -0,0 +1,258 @@
+import os
+import sys
+import time
+import argparse
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import manifest
+import plotters
+import render_queue
+import event_statistics
+import incremental
+import pipeline
+
+"""
+Batch processing of all recordings of a data folder in parallel processes.
+
+    python batch.py C:/path_to_data --workers 8 --savedata --savefig
+
+Every trial (or, in multi observer mode, every group of recordings of the same trial) is a separate job: it is read,
+classified, its events are measured and, if asked, its events and figures are saved. The jobs are started largest
+recording first, so that a long recording does not end up running alone at the end of the batch. A job that fails
+is reported and does not stop the other jobs. The summary statistics of the event measures of the jobs are merged
+per participant and for the whole dataset.
+Jobs whose results are up to date (same recordings, detector parameters and code, see incremental.py) are skipped,
+so a batch that was interrupted, or a data folder to which recordings were added, only processes the trials that
+still need it.
+"""
+
+
+def process_job(recordings, settings):
+    """
+    Classify and measure the recordings of a job, and save their results.
+
+    :param recordings: list of recording entries of the manifest with their number within their participant, as
+                       (trialindex, recording) tuples; a single recording unless in multi observer mode.
+    :param settings: batch settings, see parse_arguments.
+    :return: list with a result dictionary per recording: participant, trial, number of samples, EventStatistics of
+             the trial, the plot-ready detection data (if the figures are saved) and whether it was skipped.
+
+    """
+    folders = [incremental.output_folder(recording) for _, recording in recordings]
+    stored = [incremental.load_fingerprint(folder) for folder in folders]
+    fingerprint = incremental.fingerprint([recording for _, recording in recordings], settings, stored[0])
+    if not settings['force'] and all(incremental.matches(previous, fingerprint) for previous in stored):
+        results = []
+        for (trialindex, recording), folder in zip(recordings, folders):
+            statistics, detectiondata = incremental.load_results(folder)
+            results.append(OrderedDict([('participant', recording['participant']),
+                                        ('trial', recording['trial']),
+                                        ('trialindex', trialindex),
+                                        ('samples', 0),
+                                        ('statistics', statistics),
+                                        ('detectiondata', detectiondata),
+                                        ('skipped', True)]))
+        return results
+    for folder in folders:
+        incremental.invalidate(folder)
+
+    trialresults = pipeline.process_recordings([recording for _, recording in recordings], settings['savedata'],
+                                               settings['multiobserver'], settings['usecache'], settings['cachedir'],
+                                               settings['readworkers'], settings['debugdetection'])
+
+    results = []
+    for (trialindex, recording), folder, trialresult in zip(recordings, folders, trialresults):
+        statistics = event_statistics.EventStatistics()
+        statistics.add(trialresult['events'])
+
+        detectiondata = None
+        if settings['savefig']:
+            render_queue.render_calculation(recording['path'] + '/calculation-p{}-t{}.png'.format(
+                                                recording['participant'], recording['trial']),
+                                            recording['participant'], trialindex,
+                                            plotters.calculation_data(*trialresult['events']))
+            detectiondata = plotters.detection_data(trialresult['x'], trialresult['y'], trialresult['t'],
+                                                    trialresult['v'], *trialresult['events'], trialresult['hz'])
+        # the fingerprint is saved last, once all results of the trial are saved
+        incremental.save_results(folder, fingerprint, statistics, detectiondata)
+
+        results.append(OrderedDict([('participant', recording['participant']),
+                                    ('trial', recording['trial']),
+                                    ('trialindex', trialindex),
+                                    ('samples', len(trialresult['t'])),
+                                    ('statistics', statistics),
+                                    ('detectiondata', detectiondata),
+                                    ('skipped', False)]))
+    return results
+
+def plan_jobs(recordings, multiobserver=False):
+    """
+    Split the recordings of a manifest into jobs, largest first.
+
+    :param recordings: manifest dictionary, as made by manifest.scan.
+    :param multiobserver: whether the recordings of all participants of a trial are classified together.
+    :return: list of jobs, every job a list of (trialindex, recording) tuples.
+
+    """
+    # number of every trial within its participant, for the figure titles
+    trialindex = dict()
+    for _, participantrecordings in manifest.participants(recordings):
+        for index, recording in enumerate(participantrecordings, 1):
+            trialindex[recording['file']] = index
+
+    if multiobserver:
+        jobs = [[(trialindex[recording['file']], recording) for recording in trialrecordings]
+                for _, trialrecordings in manifest.trials(recordings)]
+    else:
+        jobs = [[(trialindex[recording['file']], recording)] for recording in recordings['recordings']]
+    return sorted(jobs, key=lambda job: -sum(recording['size'] for _, recording in job))
+
+def run(settings):
+    """
+    Process all recordings of a data folder.
+
+    :param settings: batch settings, see parse_arguments.
+    :return: tuple of the dataset EventStatistics and the list of failed jobs (recordings and error message).
+
+    """
+    datapath = settings['datapath']
+    recordings = manifest.update(datapath, settings['filename'])
+    for missing in recordings['missing']:
+        print('No gaze data found for participant {}, trial {}'.format(missing['participant'], missing['trial']))
+    jobs = plan_jobs(recordings, settings['multiobserver'])
+
+    # trials of every participant that are not finished yet, and the results of the finished ones
+    remaining = OrderedDict((participant, len(participantrecordings))
+                            for participant, participantrecordings in manifest.participants(recordings))
+    finished = OrderedDict((participant, []) for participant in remaining)
+    datasetstatistics = event_statistics.EventStatistics()
+    failed = []
+    skipped = 0
+    samples = 0
+    start = time.time()
+
+    with ProcessPoolExecutor(settings['workers']) as pool:
+        futures = {pool.submit(process_job, job, settings): job for job in jobs}
+        figures = []
+        for done, future in enumerate(as_completed(futures), 1):
+            job = futures[future]
+            names = ', '.join('participant {} trial {}'.format(recording['participant'], recording['trial'])
+                              for _, recording in job)
+            try:
+                results = future.result()
+            except Exception:
+                error = traceback.format_exc()
+                failed.append((job, error))
+                print('[{}/{}] FAILED {}: {}'.format(done, len(jobs), names, error.strip().splitlines()[-1]))
+                results = []
+                for _, recording in job:
+                    remaining[recording['participant']] -= 1
+            else:
+                samples += sum(result['samples'] for result in results)
+                if all(result['skipped'] for result in results):
+                    skipped += 1
+                    print('[{}/{}] {} is up to date'.format(done, len(jobs), names))
+                else:
+                    print('[{}/{}] {} ({:.0f} s elapsed)'.format(done, len(jobs), names, time.time() - start))
+
+            for result in results:
+                participant = result['participant']
+                finished[participant].append(result)
+                remaining[participant] -= 1
+            # the statistics and the detection figure of a participant are made once all its trials are done
+            for participant in {recording['participant'] for _, recording in job}:
+                if remaining[participant] == 0:
+                    statistics, figure = finish_participant(participant, finished.pop(participant), settings, pool)
+                    datasetstatistics.merge(statistics)
+                    if figure is not None:
+                        figures.append(figure)
+
+        for figure in figures:
+            try:
+                figure.result()
+            except Exception:
+                print('Failed to save a detection figure: {}'.format(traceback.format_exc().strip().splitlines()[-1]))
+
+    print(), print('Processed {} of {} jobs ({} up to date), {} samples in {:.1f} s'.format(
+        len(jobs) - len(failed) - skipped, len(jobs), skipped, samples, time.time() - start))
+    for job, error in failed:
+        print('Failed: {}'.format(', '.join(recording['file'] for _, recording in job)))
+        print(error)
+
+    return datasetstatistics, failed
+
+def finish_participant(participant, results, settings, pool):
+    """
+    Save the summary statistics and the detection figure of a participant whose trials are all done.
+
+    :param results: results of the trials of the participant, see process_job.
+    :param pool: process pool that renders the detection figure.
+    :return: tuple of the EventStatistics of the participant and the future of its detection figure (None if the
+             figure is not saved).
+
+    """
+    results = sorted(results, key=lambda result: result['trialindex'])
+    statistics = event_statistics.EventStatistics()
+    for result in results:
+        statistics.merge(result['statistics'])
+    if settings['savedata'] and results:
+        statistics.summary().to_csv(os.path.join(settings['datapath'], participant,
+                                                 'summary-p{}.csv'.format(participant)), index=False)
+
+    fname = os.path.join(settings['datapath'], participant, 'detection-p{}.png'.format(participant))
+    # the figure is up to date if none of the trials of the participant was processed again
+    if not settings['savefig'] or not results or \
+            (all(result['skipped'] for result in results) and os.path.isfile(fname)):
+        return statistics, None
+    return statistics, pool.submit(render_queue.render_detection, fname, participant,
+                                   [(result['trialindex'], result['detectiondata']) for result in results])
+
+def parse_arguments(arguments=None):
+    """
+    Parse the command line arguments of the batch runner.
+
+    :param arguments: list of arguments, by default the command line.
+    :return: dictionary of the batch settings.
+
+    """
+    parser = argparse.ArgumentParser(description='Detect the gaze events of all recordings in a data folder '
+                                                 '(participant/trial sub folders) in parallel processes.')
+    parser.add_argument('datapath', help='data folder with participant/trial folders')
+    parser.add_argument('--filename', default='varjo_gaze_output',
+                        help='the gaze data files have this string in their name')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes')
+    parser.add_argument('--savedata', action='store_true',
+                        help='save the gaze events and their measures in .csv files')
+    parser.add_argument('--savefig', action='store_true', help='save the figures as .png files')
+    parser.add_argument('--multiobserver', action='store_true',
+                        help='detect smooth pursuit on the recordings of all participants of a trial together')
+    parser.add_argument('--cachedir', default=None,
+                        help="folder for the cache of parsed recordings, by default a 'cache' folder per trial")
+    parser.add_argument('--nocache', action='store_true', help='do not cache the parsed recordings')
+    parser.add_argument('--force', action='store_true', help='process all trials, also those that are up to date')
+    parser.add_argument('--debugdetection', action='store_true', help='show runtime info about the detection')
+    args = parser.parse_args(arguments)
+
+    return OrderedDict([('datapath', os.path.abspath(args.datapath)),
+                        ('filename', args.filename),
+                        ('workers', max(1, args.workers)),
+                        ('savedata', args.savedata),
+                        ('savefig', args.savefig),
+                        ('multiobserver', args.multiobserver),
+                        ('cachedir', args.cachedir),
+                        ('usecache', not args.nocache),
+                        # the recordings are already parsed in parallel processes
+                        ('readworkers', 1),
+                        ('force', args.force),
+                        ('debugdetection', args.debugdetection)])
+
+
+if __name__ == '__main__':
+    settings = parse_arguments()
+    datasetstatistics, failed = run(settings)
+    print(datasetstatistics.summary().to_string(index=False))
+    if settings['savedata']:
+        datasetstatistics.summary().to_csv(os.path.join(settings['datapath'], 'summary.csv'), index=False)
+    sys.exit(1 if failed else 0)
@@ -1,5 +1,6 @@
 import copy
 import numpy as np
+import labels
 
 """
 Detecting blinks by extending the 0-confidence intervals into nearby saccades. The maximal distance to saccade is
@@ -36,6 +37,26 @@ def BlinkDetector(param, gaze_points, inplace=False):
     blink_offsets = np.nonzero(blink_diff == -1)[0]
 
     times = gaze_points['data']['time']
+    # contiguous copy, so that searching does not convert the timestamps every time
+    contiguous_times = np.ascontiguousarray(times)
+    # with sorted timestamps the search windows around the blinks can be found by binary search
+    sorted_times = bool(np.all(times[1:] >= times[:-1]))
+    max_distance = param["MAXIMAL_DISTANCE_TO_SACCADE_MILLISEC"]
+
+    # first and last sample of every saccade. Samples are only removed from saccades below (when they become part of
+    # a blink), so the samples of a saccade are always found between these two.
+    saccade_indices = gaze_points['data']['SACC_INTERVAL_INDEX']
+    saccade_ids, saccade_starts = np.unique(saccade_indices, return_index=True)
+    saccade_ends = len(saccade_indices) - 1 - np.unique(saccade_indices[::-1], return_index=True)[1]
+    # (-1 marks samples outside of saccades, their number grows)
+    saccade_starts = dict((i, start) for i, start in zip(saccade_ids.tolist(), saccade_starts.tolist()) if i >= 0)
+    saccade_ends = dict((i, end) for i, end in zip(saccade_ids.tolist(), saccade_ends.tolist()) if i >= 0)
+
+    def saccade_samples(sacc_index):
+        # current samples of the saccade @sacc_index
+        start = saccade_starts.get(sacc_index, 0)
+        end = saccade_ends.get(sacc_index, len(saccade_indices) - 1)
+        return np.nonzero(saccade_indices[start:end + 1] == sacc_index)[0] + start
 
     assert len(blink_onsets) == len(blink_offsets)
     for onset, offset in zip(blink_onsets, blink_offsets):
@@ -43,45 +64,84 @@ def BlinkDetector(param, gaze_points, inplace=False):
         if param["VERBOSE"]:
             print("Found blink from {} to {}".format(times[onset], times[offset]))
 
-        # go back in time and look for a saccade
-        onset_candidate = onset
-        while onset_candidate >= 0 \
-                and times[onset] - times[onset_candidate] < param["MAXIMAL_DISTANCE_TO_SACCADE_MILLISEC"]:
-            if gaze_points['data'][onset_candidate]['EYE_MOVEMENT_TYPE'] == 'SACCADE':
-                # Found a saccade! The blink will start at the start of this saccade
-                sacc_index = gaze_points['data'][onset_candidate]['SACC_INTERVAL_INDEX']
-                first_saccade_index = np.nonzero(
-                    gaze_points['data']['SACC_INTERVAL_INDEX'] == sacc_index)[0][0]
-                onset = first_saccade_index
-                break
-            # otherwise just continue the search backwards
-            onset_candidate -= 1
-
-        # go forward in time and look for a saccade
-        offset_candidate = offset
-        while offset_candidate < len(times) \
-                and times[offset_candidate] - times[offset] < param["MAXIMAL_DISTANCE_TO_SACCADE_MILLISEC"]:
-            if gaze_points['data'][offset_candidate]['EYE_MOVEMENT_TYPE'] == 'SACCADE':
-                # Found a saccade! The blink will end at the end of this saccade
-                sacc_index = gaze_points['data'][offset_candidate]['SACC_INTERVAL_INDEX']
-                last_saccade_index = np.nonzero(
-                    gaze_points['data']['SACC_INTERVAL_INDEX'] == sacc_index)[0][-1]
-                offset = last_saccade_index
-                break
-            # otherwise just continue the search forwards
-            offset_candidate += 1
+        # go back in time and look for a saccade (the last one that is less than @max_distance before the onset)
+        if sorted_times:
+            window_start = _window_start(contiguous_times, onset, max_distance)
+        else:
+            window_start = onset + 1
+            while window_start > 0 and times[onset] - times[window_start - 1] < max_distance:
+                window_start -= 1
+        candidates = np.nonzero(gaze_points['data']['EYE_MOVEMENT_TYPE'][window_start:onset + 1] ==
+                                labels.SACCADE)[0]
+        if len(candidates) > 0:
+            # Found a saccade! The blink will start at the start of this saccade
+            sacc_index = gaze_points['data'][window_start + candidates[-1]]['SACC_INTERVAL_INDEX']
+            onset = saccade_samples(sacc_index)[0]
+
+        # go forward in time and look for a saccade (the first one that is less than @max_distance after the offset)
+        if sorted_times:
+            window_end = _window_end(contiguous_times, offset, max_distance)
+        else:
+            window_end = offset
+            while window_end < len(times) and times[window_end] - times[offset] < max_distance:
+                window_end += 1
+        candidates = np.nonzero(gaze_points['data']['EYE_MOVEMENT_TYPE'][offset:window_end] == labels.SACCADE)[0]
+        if len(candidates) > 0:
+            # Found a saccade! The blink will end at the end of this saccade
+            sacc_index = gaze_points['data'][offset + candidates[0]]['SACC_INTERVAL_INDEX']
+            offset = saccade_samples(sacc_index)[-1]
 
         if param["VERBOSE"]:
             print("Extended it to {} {}".format(times[onset], times[offset]))
 
         # remove gaps in data that are to short to be blinks.
         if times[offset] - times[onset] < param['MINIMAL_BLINK_DURATION_MILLISEC']:
-            gaze_points['data'][onset:offset + 1]['EYE_MOVEMENT_TYPE'] = 'NOISE'
+            gaze_points['data'][onset:offset + 1]['EYE_MOVEMENT_TYPE'] = labels.NOISE
         else:
-            gaze_points['data'][onset:offset + 1]['EYE_MOVEMENT_TYPE'] = 'BLINK'
+            gaze_points['data'][onset:offset + 1]['EYE_MOVEMENT_TYPE'] = labels.BLINK
             # this is not a saccade anymore
             gaze_points['data'][onset:offset + 1]['SACC_INTERVAL_INDEX'] = -1
             # nor is it a normal sequence between saccades
             gaze_points['data'][onset:offset + 1]['INTERSACC_INTERVAL_INDEX'] = -1
 
     return gaze_points
+
+def _window_start(times, index, max_distance):
+    """
+    Find the first sample of the uninterrupted sequence of samples up to @index that are less than @max_distance
+    before the sample @index, in sorted @times. The distance is the difference of the (float32) timestamps.
+
+    :param times: sorted timestamps.
+    :param index: index of the sample the window ends at.
+    :param max_distance: maximal distance to the sample @index.
+    :return: index of the first sample in the window (@index + 1 if the window is empty).
+
+    """
+    start = int(np.searchsorted(times, times.dtype.type(times[index] - max_distance), side='left'))
+    start = min(start, index + 1)
+    # correct the search for the rounding of the timestamp differences
+    while start > 0 and times[index] - times[start - 1] < max_distance:
+        start -= 1
+    while start <= index and not (times[index] - times[start] < max_distance):
+        start += 1
+    return start
+
+def _window_end(times, index, max_distance):
+    """
+    Find the end of the uninterrupted sequence of samples from @index on that are less than @max_distance after the
+    sample @index, in sorted @times. The distance is the difference of the (float32) timestamps.
+
+    :param times: sorted timestamps.
+    :param index: index of the sample the window starts at.
+    :param max_distance: maximal distance to the sample @index.
+    :return: index after the last sample in the window (@index if the window is empty).
+
+    """
+    end = int(np.searchsorted(times, times.dtype.type(times[index] + max_distance), side='right'))
+    end = max(end, index)
+    # correct the search for the rounding of the timestamp differences
+    while end > index and not (times[end - 1] - times[index] < max_distance):
+        end -= 1
+    while end < len(times) and times[end] - times[index] < max_distance:
+        end += 1
+    return end
@@ -0,0 +1,243 @@
+import os
+import json
+import hashlib
+import pandas
+import numpy as np
+from collections import OrderedDict
+
+import readers
+
+"""
+Persistent cache of parsed recordings, so that unchanged .csv files do not have to be parsed and patched again.
+
+Every entry is a single .npz file holding the output of readers.file_reader (as one array per column) and of
+readers.gaze_arff (the structured data array), together with a small json header that describes the source file.
+An entry is found by the path of the recording and the reader settings, and is only used if the size, modification
+time or (when only the modification time changed) the content hash of the recording still match. In the latter case
+the entry is stored again with the new modification time, so the recording is only hashed once.
+Text columns are stored as fixed-width unicode arrays with a mask of their missing values, so that every entry can be
+loaded without pickle.
+The least recently used entries are removed once a cache folder grows beyond its size limit.
+"""
+
+# increase when the content of the entries changes, so that old entries are not used anymore
+CACHE_VERSION = 3
+# default size limit of a cache folder in bytes
+DEFAULT_MAX_BYTES = 2 * 2 ** 30
+# name of the cache folder that is created in the trial folder when no cache folder is given
+TRIAL_CACHE_FOLDER = 'cache'
+
+
+def read_trial(path, participant, trial, filename, cache_dir=None, columns=None, workers=1, engine=None,
+               max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Cached version of readers.file_reader followed by readers.gaze_arff.
+
+    :param path: folder of the trial, the first .csv file with @filename in its name is read.
+    :param filename: (part of) the name of the gaze data file.
+    :param cache_dir: folder in which the entries are stored, None to store them in a folder next to the recording.
+    :param columns: columns to parse, see readers.file_reader.
+    :param workers: number of threads that parse large files, see readers.file_reader.
+    :param engine: pandas parser engine, see readers.file_reader.
+    :param max_bytes: size limit of the cache folder, least recently used entries are removed above it.
+    :return: tuple of the gaze data as pandas DataFrame and the arff object made from it.
+
+    """
+    file = [i for i in os.listdir(path) if os.path.isfile(os.path.join(path, i)) and \
+            filename in i and i.endswith('.csv')]
+
+    return read_recording(os.path.join(path, file[0]), cache_dir, columns, workers, engine, max_bytes)
+
+def read_recording(file, cache_dir=None, columns=None, workers=1, engine=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Cached version of readers.recording_reader followed by readers.gaze_arff.
+
+    :param file: path to the gaze data .csv file.
+    :param cache_dir: folder in which the entries are stored, None to store them in a folder next to the recording.
+    :param columns: columns to parse, see readers.file_reader.
+    :param workers: number of threads that parse large files, see readers.file_reader.
+    :param engine: pandas parser engine, see readers.file_reader.
+    :param max_bytes: size limit of the cache folder, least recently used entries are removed above it.
+    :return: tuple of the gaze data as pandas DataFrame and the arff object made from it.
+
+    """
+    file = os.path.abspath(file)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(file), TRIAL_CACHE_FOLDER)
+    if engine is None:
+        engine = readers.DEFAULT_ENGINE
+
+    settings = OrderedDict([('version', CACHE_VERSION),
+                            ('file', file),
+                            ('columns', None if columns is None else
+                                        [(name, np.dtype(dtype).str) for name, dtype in columns.items()]),
+                            ('engine', engine)])
+    key = hashlib.sha1(json.dumps(settings).encode()).hexdigest()
+    entry = os.path.join(cache_dir, key + '.npz')
+
+    stat = os.stat(file)
+    cached = load_entry(entry, file, stat)
+    if cached is not None:
+        # mark the entry as recently used
+        os.utime(entry)
+        return cached
+
+    csvdata = readers.recording_reader(file, columns, workers, engine)
+    gaze_points = readers.gaze_arff(csvdata)
+
+    header = OrderedDict([('settings', settings),
+                          ('size', stat.st_size),
+                          ('mtime_ns', stat.st_mtime_ns),
+                          ('digest', file_digest(file))])
+    save_entry(entry, header, csvdata, gaze_points)
+    evict(cache_dir, max_bytes)
+
+    return csvdata, gaze_points
+
+def read_gaze_data(file, alldata=False, usecache=True, cache_dir=None, workers=1):
+    """
+    Read a recording for the detection, as main.py and batch.py do.
+
+    :param file: path to the gaze data .csv file.
+    :param alldata: whether all columns are parsed (to save them with the classification), otherwise only the
+                    columns needed for detection (readers.GAZE_COLUMNS).
+    :param usecache: whether the parsed recording is taken from (or stored in) the cache.
+    :param cache_dir: folder in which the entries are stored, None to store them in a folder next to the recording.
+    :param workers: number of threads that parse large files, see readers.file_reader.
+    :return: tuple of the gaze data as pandas DataFrame and the arff object made from it.
+
+    """
+    # only the columns needed for detection are parsed, unless the full data is saved with the classification
+    columns = None if alldata else readers.GAZE_COLUMNS
+    if usecache:
+        return read_recording(file, cache_dir, columns, workers)
+    csvdata = readers.recording_reader(file, columns, workers)
+    return csvdata, readers.gaze_arff(csvdata)
+
+def file_digest(file, block_size=2 ** 20):
+    """
+    Hash the content of a file.
+
+    :param file: path to the file.
+    :param block_size: number of bytes hashed at once.
+    :return: hexadecimal blake2b digest of the file.
+
+    """
+    digest = hashlib.blake2b()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_entry(entry, file, stat):
+    """
+    Load a cache entry if it still matches the recording it was made from.
+
+    :param entry: path of the .npz cache entry.
+    :param file: path of the recording.
+    :param stat: os.stat result of the recording.
+    :return: tuple of the gaze data as pandas DataFrame and the arff object, or None if the entry is missing or stale.
+
+    """
+    if not os.path.isfile(entry):
+        return None
+
+    try:
+        with np.load(entry, allow_pickle=False) as npz:
+            header = json.loads(str(npz['header']))
+            if header['size'] != stat.st_size:
+                return None
+            touched = header['mtime_ns'] != stat.st_mtime_ns
+            if touched and header['digest'] != file_digest(file):
+                return None
+
+            index = pandas.Index(npz['csv_index'])
+            text_columns = dict(header.get('csv_text_columns', []))
+            columns = OrderedDict()
+            for name in header['csv_columns']:
+                if name in text_columns:
+                    values = npz['csv_' + name].astype(object)
+                    values[npz['csvmissing_' + name]] = np.nan
+                    columns[name] = pandas.Series(values, index=index, dtype=text_columns[name])
+                else:
+                    columns[name] = pandas.Series(npz['csv_' + name], index=index)
+            csvdata = pandas.DataFrame(columns, index=index)
+            gaze_points = {
+                'relation': header['arff']['relation'],
+                'description': header['arff']['description'],
+                'data': npz['arff_data'],
+                'metadata': OrderedDict(header['arff']['metadata']),
+                # categorical attribute types are stored as json lists
+                'attributes': [(name, tuple(dtype) if isinstance(dtype, list) else dtype)
+                               for name, dtype in header['arff']['attributes']]
+            }
+    except (OSError, ValueError, KeyError):
+        # damaged or incompatible entry, it is replaced
+        return None
+
+    if touched:
+        # same content, the entry is stored with the new modification time so the recording is not hashed again
+        header['mtime_ns'] = stat.st_mtime_ns
+        save_entry(entry, header, csvdata, gaze_points)
+    return csvdata, gaze_points
+
+def save_entry(entry, header, csvdata, gaze_points):
+    """
+    Store the gaze data and arff object of a recording as a cache entry.
+    The entry is written to a temporary file first, so a crash never leaves a partial entry behind.
+
+    :param entry: path of the .npz cache entry.
+    :param header: dictionary describing the recording and the reader settings.
+    :param csvdata: gaze data as pandas DataFrame.
+    :param gaze_points: arff object made from @csvdata.
+
+    """
+    header = OrderedDict(header)
+    header['csv_columns'] = [str(name) for name in csvdata.columns]
+    header['arff'] = OrderedDict([('relation', gaze_points['relation']),
+                                  ('description', gaze_points['description']),
+                                  ('metadata', gaze_points['metadata']),
+                                  ('attributes', gaze_points['attributes'])])
+
+    arrays = OrderedDict()
+    text_columns = []
+    for name in header['csv_columns']:
+        column = csvdata[name]
+        if isinstance(column.dtype, np.dtype) and column.dtype.kind in 'biufcmM':
+            arrays['csv_' + name] = column.to_numpy()
+        else:
+            # object arrays can only be stored with pickle, so text is stored as fixed-width unicode
+            arrays['csv_' + name] = column.fillna('').astype(str).to_numpy(dtype=str)
+            arrays['csvmissing_' + name] = column.isna().to_numpy()
+            text_columns.append([name, str(column.dtype)])
+    header['csv_text_columns'] = text_columns
+    arrays['header'] = np.array(json.dumps(header))
+    arrays['csv_index'] = csvdata.index.to_numpy()
+    arrays['arff_data'] = gaze_points['data']
+
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    temporary = entry + '.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temporary, entry)
+
+def evict(cache_dir, max_bytes):
+    """
+    Remove the least recently used entries of a cache folder until it is not larger than @max_bytes.
+
+    :param cache_dir: cache folder.
+    :param max_bytes: size limit of the cache folder.
+
+    """
+    entries = []
+    for item in os.scandir(cache_dir):
+        if item.is_file() and item.name.endswith('.npz'):
+            stat = item.stat()
+            entries.append((stat.st_mtime_ns, stat.st_size, item.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
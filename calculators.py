@@ -1,71 +1,77 @@
 import numpy
-import numpy as np
+import labels
+from event_table import EventTable
 
 """
 Calculate measures of the detected gaze events, such as:
 ["t_start", 't_end', 'duration', 'x_start', 'y_start', 'x_end', 'y_end', 'amplitude', 'mean_vel', 'max_vel']
+
+The start and end of the events of all labels are found in a single run-length encoding pass over the labels
+(event_runs), which can be passed to every calculator. The events are returned as EventTable, whose measures are
+only computed when they are read.
 """
 
-def fixation(x, y, time, events, printing):
+def event_runs(events):
+    """
+    Find the start and end indices of the events of every label at once.
+
+    The end index of an event is the first sample after it, or the last sample of the recording for an event that
+    lasts until the end. If the recording starts with an event of a label, neither that event nor the last event of
+    the label is counted.
+
+	arguments
+	events      -   numpy array of of detected gaze events (label codes, see labels.py)
+
+	returns
+				runs		-	dictionary label code -> (numpy array of start indices, numpy array of end indices)
+	"""
+    events = numpy.asarray(events)
+
+    # run-length encoding: every run of equal labels
+    changes = numpy.flatnonzero(events[1:] != events[:-1]) + 1
+    run_starts = numpy.concatenate([[0], changes])
+    run_ends = numpy.concatenate([changes, [len(events)]])
+    run_labels = events[run_starts]
+    run_ends[run_ends == len(events)] = len(events) - 1
+
+    runs = dict()
+    for label in range(len(labels.EVENTS)):
+        starts = run_starts[run_labels == label]
+        ends = run_ends[run_labels == label]
+        if events[0] == label:
+            starts = starts[1:-1]
+            ends = ends[1:-1]
+        runs[label] = (starts, ends)
+
+    return runs
+
+
+def fixation(x, y, time, events, printing, runs=None):
     """
     Calculate fixation measures
 	
 	arguments
 	time		-	numpy array of EyeTribe timestamps
-	events      -   numpy array of of detected gaze events
+	events      -   numpy array of of detected gaze events (label codes, see labels.py)
+	runs        -   (optional) event_runs(events), if it is already computed
 
 	returns
-				Fixations	-	list of lists, each containing [starttime, endtime, duration, endx, endy]
+				Fixations	-	EventTable, with the measures [t_start, t_end, duration, x_pos, y_pos]
 	"""
 
-    # empty list to contain data
-    Fixations = []
-
-    # check where the missing samples are
-    idx = numpy.array(events == 'FIX', dtype=int)
-
-    # check where the starts and ends are (+1 to counteract shift to left)
-    diff = numpy.diff(idx)
-    starts = numpy.where(diff == 1)[0] + 1
-    ends = numpy.where(diff == -1)[0] + 1
-
-    # delete detected starts and ends from before and after recording
-    if idx[-0] == 1:
-        starts = starts[0:-1]
-    if idx[0] == 1:
-        ends = ends[1::]
-    if len(starts) > len(ends):
-        ends = np.append(ends, len(idx) - 1)
-
-    # compile fixation starts and ends
-    for i in range(len(starts)):
-        # get starting index
-        s = starts[i]
-        # get ending index
-        if i < len(ends):
-            e = ends[i]
-        elif len(ends) > 0:
-            e = ends[-1]
-        else:
-            e = -1
-
-        # add ending time
-        xpos = np.mean([x[s], x[e]])
-        ypos = np.mean([y[s], y[e]])
-        duration = time[e] - time[s]
-        Fixations.append([time[s], time[e], duration, xpos, ypos])
-
-    Fixations = numpy.array(Fixations)
-    if Fixations.any() and printing:
+    runs = runs if runs is not None else event_runs(events)
+    Fixations = EventTable.from_runs(labels.FIX, runs, time=time, x=x, y=y)
+
+    if len(Fixations) > 0 and printing:
         numFix = len(Fixations)
-        avgFix = 1000 * sum(Fixations[:, 2]) / numFix
+        avgFix = 1000 * sum(Fixations.duration) / numFix
         print('Number of fixations: ' + str(numFix))
         print('     Average fixation duration: ' + str(avgFix) + 'ms')
 
     return Fixations
 
 
-def saccade(x, y, v, time, events, printing):
+def saccade(x, y, v, time, events, printing, runs=None):
     """
     Calculate Saccade measures
 
@@ -75,58 +81,22 @@ def saccade(x, y, v, time, events, printing):
 	y		-	numpy array of y positions
 	v       -   numpy array of velocities
 	time	-	numpy array of trafcker timestamps in milliseconds
-    events      -   numpy array of of detected gaze events
+    events      -   numpy array of of detected gaze events (label codes, see labels.py)
+    runs        -   (optional) event_runs(events), if it is already computed
 
 	returns
-			Saccades	-	list of lists, each containing [starttime, endtime, duration, startx, starty, endx, endy,  amplitude, meanvel, maxvel])]
+			Saccades	-	EventTable, with the measures [t_start, t_end, duration, x_start, y_start, x_end, y_end, amplitude, mean_vel, max_vel]
 	"""
 
-    # empty list to contain data
-    Saccades = []
-
-    # check where the missing samples are
-    idx = numpy.array(events == 'SACCADE', dtype=int)
-
-    # check where the starts and ends are (+1 to counteract shift to left)
-    diff = numpy.diff(idx)
-    starts = numpy.where(diff == 1)[0] + 1
-    ends = numpy.where(diff == -1)[0] + 1
-
-    # delete detected starts and ends from before and after recording
-    if idx[-0] == 1:
-        starts = starts[0:-1]
-    if idx[0] == 1:
-        ends = ends[1::]
-    if len(starts) > len(ends):
-        ends = np.append(ends, len(idx) - 1)
-
-    # compile saccade starts and ends
-    for i in range(len(starts)):
-        # get starting index
-        s = starts[i]
-        # get ending index
-        if i < len(ends):
-            e = ends[i]
-        elif len(ends) > 0:
-            e = ends[-1]
-        else:
-            e = -1
-
-        # writing data
-        duration = time[e] - time[s]
-        amplitude = ((x[s] - x[e]) ** 2 + (y[s] - y[e]) ** 2) ** 0.5
-        meanvel = sum(v[s:e]) / len(v[s:e])
-        maxvel = max(v[s:e])
-
-        Saccades.append([time[s], time[e], duration, x[s], y[s], x[e], y[e], amplitude, meanvel, maxvel])
-
-    Saccades = numpy.array(Saccades)
-    if Saccades.any() and printing:
+    runs = runs if runs is not None else event_runs(events)
+    Saccades = EventTable.from_runs(labels.SACCADE, runs, time=time, x=x, y=y, v=v)
+
+    if len(Saccades) > 0 and printing:
         numSac = len(Saccades)
-        avgSacT = 1000 * sum(Saccades[:, 2]) / numSac
-        avgSacA = sum(Saccades[:, 7]) / numSac
-        avgSacV = sum(Saccades[:, 8]) / numSac
-        avgSacMV = sum(Saccades[:, 9]) / numSac
+        avgSacT = 1000 * sum(Saccades.duration) / numSac
+        avgSacA = sum(Saccades.amplitude) / numSac
+        avgSacV = sum(Saccades.mean_vel) / numSac
+        avgSacMV = sum(Saccades.max_vel) / numSac
         print('Number of saccades: ' + str(numSac))
         print('     Average saccades duration: ' + str(avgSacT) + ' ms')
         print('     Average saccades Amplitude: ' + str(avgSacA) + ' deg')
@@ -136,7 +106,7 @@ def saccade(x, y, v, time, events, printing):
     return Saccades
 
 
-def pursuit(x, y, v, time, events, printing):
+def pursuit(x, y, v, time, events, printing, runs=None):
     """
     Calculates Pursuit measures
 	arguments
@@ -145,57 +115,21 @@ def pursuit(x, y, v, time, events, printing):
 	y		-	numpy array of y positions
 	v       -   numpy array of velocities
 	time	-	numpy array of tracker timestamps in milliseconds
-    events      -   numpy array of of detected gaze events
+    events      -   numpy array of of detected gaze events (label codes, see labels.py)
+    runs        -   (optional) event_runs(events), if it is already computed
 
 	returns
-				Pursuits	-	list of lists, each containing [starttime, endtime, duration, startx, starty, endx, endy,  amplitude, meanvel, maxvel])]
+				Pursuits	-	EventTable, with the measures [t_start, t_end, duration, x_start, y_start, x_end, y_end, amplitude, mean_vel, max_vel]
 	"""
-    # empty list to contain data
-    Pursuits = []
-
-    # check where the missing samples are
-    idx = numpy.array(events == 'SP', dtype=int)
-
-    # check where the starts and ends are (+1 to counteract shift to left)
-    diff = numpy.diff(idx)
-    starts = numpy.where(diff == 1)[0] + 1
-    ends = numpy.where(diff == -1)[0] + 1
-
-    # delete detected starts and ends from before and after recording
-    if idx[-0] == 1:
-        starts = starts[0:-1]
-    if idx[0] == 1:
-        ends = ends[1::]
-    if len(starts) > len(ends):
-        ends = np.append(ends, len(idx) - 1)
-
-    # compile pursuit starts and ends
-    for i in range(len(starts)):
-        # get starting index
-        s = starts[i]
-        # get ending index
-        if i < len(ends):
-            e = ends[i]
-        elif len(ends) > 0:
-            e = ends[-1]
-        else:
-            e = -1
-
-        # writing data
-        duration = time[e] - time[s]
-        amplitude = ((x[s] - x[e]) ** 2 + (y[s] - y[e]) ** 2) ** 0.5
-        meanvel = sum(v[s:e]) / len(v[s:e])
-        maxvel = max(v[s:e])
-
-        Pursuits.append([time[s], time[e], duration, x[s], y[s], x[e], y[e], amplitude, meanvel, maxvel])
-
-    Pursuits = numpy.array(Pursuits)
-    if Pursuits.any() and printing:
+    runs = runs if runs is not None else event_runs(events)
+    Pursuits = EventTable.from_runs(labels.SP, runs, time=time, x=x, y=y, v=v)
+
+    if len(Pursuits) > 0 and printing:
         numSP = len(Pursuits)
-        avgSPT = 1000 * sum(Pursuits[:, 2]) / numSP
-        avgSPA = sum(Pursuits[:, 7]) / numSP
-        avgSPV = sum(Pursuits[:, 8]) / numSP
-        avgSPMV = sum(Pursuits[:, 9]) / numSP
+        avgSPT = 1000 * sum(Pursuits.duration) / numSP
+        avgSPA = sum(Pursuits.amplitude) / numSP
+        avgSPV = sum(Pursuits.mean_vel) / numSP
+        avgSPMV = sum(Pursuits.max_vel) / numSP
         print('Number of Smooth Pursuits: ' + str(numSP))
         print('     Average pursuit duration: ' + str(avgSPT) + 'ms')
         print('     Average pursuit Amplitude: ' + str(avgSPA) + ' deg')
@@ -205,55 +139,25 @@ def pursuit(x, y, v, time, events, printing):
     return Pursuits
 
 
-def blink(time, events, printing):
+def blink(time, events, printing, runs=None):
     """
     Calculates Blink measures
 	arguments
                 time		-	numpy array of EyeTribe timestamps
-                events      -   numpy array of of detected gaze events
+                events      -   numpy array of of detected gaze events (label codes, see labels.py)
+                runs        -   (optional) event_runs(events), if it is already computed
 
 	returns
-		        Blinks	-	list of lists, each containing [starttime, endtime, duration]
+		        Blinks	-	EventTable, with the measures [t_start, t_end, duration]
 	"""
-    # empty list to contain data
-    Blinks = []
-
-    # check where the missing samples are
-    idx = numpy.array(events == 'BLINK', dtype=int)
-
-    # check where the starts and ends are (+1 to counteract shift to left)
-    diff = numpy.diff(idx)
-    starts = numpy.where(diff == 1)[0] + 1
-    ends = numpy.where(diff == -1)[0] + 1
-
-    # delete detected starts and ends from before and after recording
-    if idx[-0] == 1:
-        starts = starts[0:-1]
-    if idx[0] == 1:
-        ends = ends[1::]
-    if len(starts) > len(ends):
-        ends = np.append(ends, len(idx) - 1)
-
-    # compile blink starts and ends
-    for i in range(len(starts)):
-        # get starting index
-        s = starts[i]
-        # get ending index
-        if i < len(ends):
-            e = ends[i]
-        elif len(ends) > 0:
-            e = ends[-1]
-        else:
-            e = -1
-
-        # add ending time
-        Blinks.append([time[s], time[e], time[e] - time[s]])
-
-    Blinks = numpy.array(Blinks)
-    if Blinks.any() and printing:
+    runs = runs if runs is not None else event_runs(events)
+    Blinks = EventTable.from_runs(labels.BLINK, runs, time=time)
+
+    if len(Blinks) > 0 and printing:
         numBlk = len(Blinks)
-        avgBlk = 1000 * sum(Blinks[:, 2]) / numBlk
+        avgBlk = 1000 * sum(Blinks.duration) / numBlk
         print('Number of blinks: ' + str(numBlk))
         print('     Average blink duration: ' + str(avgBlk) + 'ms')
 
     return Blinks
+
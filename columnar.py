@@ -0,0 +1,158 @@
+import os
+import json
+import numpy as np
+from collections import OrderedDict
+
+import readers
+import functions
+
+"""
+Columnar binary format for gaze recordings, which can be memory mapped instead of parsed.
+
+A file starts with a small header:
+    - 8 bytes magic string b'VGDCOLS\0'
+    - 4 bytes little endian unsigned integer: length of the json description that follows
+    - json description: format version, number of rows, source file and for every column its name, dtype and offset
+followed by one contiguous array per column. Every column starts at a multiple of ALIGNMENT bytes.
+
+The stored columns are the ones the detection works with, i.e. the output of readers.gaze_columns: time [ms],
+gaze angles x and y [deg] and the status of each sample, with the types they have in the arff object.
+Loading returns read-only np.memmap views, so processes that load the same recording share one page-cached copy,
+and selecting a time range only maps the part of the file that is used.
+"""
+
+MAGIC = b'VGDCOLS\0'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+EXTENSION = '.vgd'
+# stored columns and their types
+COLUMNS = OrderedDict([('time', np.dtype('<f4')),
+                       ('x', np.dtype('<f4')),
+                       ('y', np.dtype('<f4')),
+                       ('status', np.dtype('<i1'))])
+
+
+def convert(csv_file, output=None, workers=1, engine=None):
+    """
+    Convert a Varjo gaze data .csv file into the columnar format.
+
+    :param csv_file: path to the .csv file.
+    :param output: path of the created file, by default the .csv path with the EXTENSION instead of '.csv'.
+    :param workers: number of threads that parse large files, see readers.file_reader.
+    :param engine: pandas parser engine, see readers.file_reader.
+    :return: path of the created file.
+
+    """
+    if output is None:
+        output = os.path.splitext(csv_file)[0] + EXTENSION
+
+    csvdata = readers.recording_reader(csv_file, columns=readers.GAZE_COLUMNS, workers=workers, engine=engine)
+    x, y, t, s = readers.gaze_columns(csvdata)
+    write(output, OrderedDict([('time', t), ('x', x), ('y', y), ('status', s)]), source=os.path.basename(csv_file))
+
+    return output
+
+def write(file, columns, source=''):
+    """
+    Write columns of gaze data to a file in the columnar format.
+    The file is written to a temporary file first, so a crash never leaves a partial file behind.
+
+    :param file: path of the created file.
+    :param columns: dictionary with an array for each of the COLUMNS, all of the same length.
+    :param source: name of the file the data was read from, stored in the header.
+
+    """
+    rows = len(columns['time'])
+    description = OrderedDict([('version', FORMAT_VERSION),
+                               ('rows', rows),
+                               ('source', source),
+                               ('columns', [])])
+
+    # the offsets depend on the length of the description, so reserve enough space for the largest offsets first
+    offset = 0
+    for name, dtype in COLUMNS.items():
+        description['columns'].append(OrderedDict([('name', name), ('dtype', dtype.str), ('offset', 0)]))
+    data_start = _aligned(len(MAGIC) + 4 + len(json.dumps(description)) + 20 * len(COLUMNS))
+    for column in description['columns']:
+        column['offset'] = data_start + offset
+        offset = _aligned(offset + rows * COLUMNS[column['name']].itemsize)
+
+    header = json.dumps(description).encode()
+    header += b' ' * (data_start - len(MAGIC) - 4 - len(header))
+
+    temporary = file + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint32(len(header)).tobytes())
+        f.write(header)
+        for column in description['columns']:
+            f.seek(column['offset'])
+            f.write(np.ascontiguousarray(columns[column['name']], dtype=column['dtype']).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(temporary, file)
+
+def read_header(file):
+    """
+    Read the json description of a file in the columnar format.
+
+    :param file: path to the file.
+    :return: dictionary with the format version, number of rows, source file and columns.
+
+    """
+    with open(file, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a columnar gaze recording'.format(file))
+        length = int(np.frombuffer(f.read(4), dtype='<u4')[0])
+        description = json.loads(f.read(length).decode())
+
+    if description['version'] > FORMAT_VERSION:
+        raise ValueError('{} has format version {}, only versions up to {} can be read'.format(
+            file, description['version'], FORMAT_VERSION))
+    return description
+
+def load(file, start_ms=None, end_ms=None):
+    """
+    Memory map the columns of a file in the columnar format, without reading or copying the data.
+
+    :param file: path to the file.
+    :param start_ms: if given, only the samples from this time on [ms] are returned.
+    :param end_ms: if given, only the samples up to and including this time [ms] are returned.
+    :return: dictionary of column name -> read-only np.memmap view.
+
+    """
+    description = read_header(file)
+    rows = description['rows']
+
+    columns = OrderedDict()
+    for column in description['columns']:
+        if rows > 0:
+            columns[column['name']] = np.memmap(file, dtype=column['dtype'], mode='r', offset=column['offset'],
+                                                shape=(rows,))
+        else:
+            # an empty file region can not be memory mapped
+            columns[column['name']] = np.empty(0, dtype=column['dtype'])
+
+    # the time stamps are sorted, so a time range is a slice of every column
+    start = 0 if start_ms is None else np.searchsorted(columns['time'], start_ms, side='left')
+    end = rows if end_ms is None else np.searchsorted(columns['time'], end_ms, side='right')
+    if start > 0 or end < rows:
+        for name in columns:
+            columns[name] = columns[name][start:end]
+
+    return columns
+
+def load_arff(file, start_ms=None, end_ms=None):
+    """
+    Load (a time range of) a file in the columnar format as arff object for the detection.
+
+    :param file: path to the file.
+    :param start_ms: if given, only the samples from this time on [ms] are loaded.
+    :param end_ms: if given, only the samples up to and including this time [ms] are loaded.
+    :return: arff object with the gaze data, as made by readers.gaze_arff.
+
+    """
+    columns = load(file, start_ms, end_ms)
+    return functions.load_CSV_as_arff_object(columns['x'], columns['y'], columns['time'], columns['status'], file)
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
@@ -0,0 +1,327 @@
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+import labels
+
+"""
+Streaming summary statistics of the measures of detected gaze events.
+
+An EventStatistics object takes the event tables of one trial at a time (add) and keeps, per event type and measure,
+only running statistics: the number of events, mean and variance (Welford), minimum and maximum, a histogram with
+fixed bins and a quantile sketch. The memory use does not grow with the number of trials, and statistics of
+different trials, participants or worker processes can be combined with merge, e.g. per participant statistics
+merged into statistics of the whole dataset.
+"""
+
+# measures that are summarized, per event type
+SUMMARY_MEASURES = OrderedDict([(labels.FIX, ['duration']),
+                                (labels.SACCADE, ['duration', 'amplitude', 'mean_vel', 'max_vel']),
+                                (labels.SP, ['duration', 'amplitude', 'mean_vel', 'max_vel']),
+                                (labels.BLINK, ['duration'])])
+# fixed histogram range of the measures (values outside are counted in an under- or overflow bin)
+HISTOGRAM_RANGES = {'duration': (0.0, 2.0),             # [s]
+                    'amplitude': (0.0, 40.0),           # [deg]
+                    'mean_vel': (0.0, 800.0),           # [deg/s]
+                    'max_vel': (0.0, 1200.0),           # [deg/s]
+                    'dispersion': (0.0, 10.0)}          # [deg]
+HISTOGRAM_BINS = 40
+# relative accuracy of the quantiles
+QUANTILE_ACCURACY = 0.01
+# quantiles in the summary table
+SUMMARY_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+class QuantileSketch(object):
+    """
+    Mergeable quantile sketch with a relative accuracy (DDSketch): values are counted in logarithmic buckets, so every
+    quantile is known up to a factor (1 +- @relative_accuracy) and the number of buckets only grows with the
+    logarithm of the range of the values.
+    """
+    def __init__(self, relative_accuracy=QUANTILE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        # bucket -> count, for the positive values and the magnitudes of the negative values
+        self.positive = dict()
+        self.negative = dict()
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, values):
+        """
+        Count values in the sketch.
+
+        :param values: numpy array of values, nan values are skipped.
+
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        for store, magnitudes in ((self.positive, values[values > 0]), (self.negative, -values[values < 0])):
+            buckets, counts = np.unique(np.ceil(np.log(magnitudes) / np.log(self.gamma)).astype(int),
+                                        return_counts=True)
+            for bucket, count in zip(buckets.tolist(), counts.tolist()):
+                store[bucket] = store.get(bucket, 0) + count
+        self.zeros += np.count_nonzero(values == 0)
+        self.count += len(values)
+
+    def merge(self, other):
+        """
+        Add the counts of another sketch (with the same accuracy) to this one.
+
+        :param other: QuantileSketch.
+
+        """
+        if other.gamma != self.gamma:
+            raise ValueError('Sketches with a different accuracy cannot be merged')
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for bucket, count in other_store.items():
+                store[bucket] = store.get(bucket, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q):
+        """
+        Estimate a quantile of the counted values.
+
+        :param q: quantile, between 0 and 1.
+        :return: estimated value of the quantile, nan if no values were counted.
+
+        """
+        if self.count == 0:
+            return np.nan
+
+        # buckets in increasing order of their values: negative values, zeros, positive values
+        values = [-self._bucket_value(bucket) for bucket in sorted(self.negative, reverse=True)] + [0.0] + \
+                 [self._bucket_value(bucket) for bucket in sorted(self.positive)]
+        counts = [self.negative[bucket] for bucket in sorted(self.negative, reverse=True)] + [self.zeros] + \
+                 [self.positive[bucket] for bucket in sorted(self.positive)]
+        position = np.searchsorted(np.cumsum(counts), q * (self.count - 1), side='right')
+        return values[min(position, len(values) - 1)]
+
+    def to_dict(self):
+        """
+        Contents of the sketch as a json compatible dictionary, see from_dict.
+        """
+        return OrderedDict([('relative_accuracy', self.relative_accuracy),
+                            ('positive', [[bucket, count] for bucket, count in sorted(self.positive.items())]),
+                            ('negative', [[bucket, count] for bucket, count in sorted(self.negative.items())]),
+                            ('zeros', int(self.zeros)),
+                            ('count', int(self.count))])
+
+    @classmethod
+    def from_dict(cls, contents):
+        """
+        Make a sketch from the contents stored with to_dict.
+        """
+        sketch = cls(contents['relative_accuracy'])
+        sketch.positive = {bucket: count for bucket, count in contents['positive']}
+        sketch.negative = {bucket: count for bucket, count in contents['negative']}
+        sketch.zeros = contents['zeros']
+        sketch.count = contents['count']
+        return sketch
+
+    def _bucket_value(self, bucket):
+        # value in the middle (relative to the accuracy) of the bucket
+        return 2 * self.gamma ** bucket / (self.gamma + 1)
+
+
+class MeasureStatistics(object):
+    """
+    Running statistics of one measure: count, mean and variance (Welford), minimum, maximum, a fixed bin histogram
+    and a quantile sketch. nan values are counted separately and otherwise skipped.
+    """
+    def __init__(self, histogram_range=(0.0, 1.0), bins=HISTOGRAM_BINS):
+        self.count = 0
+        self.nan_count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self.histogram_edges = np.linspace(histogram_range[0], histogram_range[1], bins + 1)
+        # underflow bin, the bins and an overflow bin
+        self.histogram = np.zeros(bins + 2, dtype=np.int64)
+        self.sketch = QuantileSketch()
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def add(self, values):
+        """
+        Add the values of a batch (e.g. a trial) to the statistics.
+
+        :param values: numpy array of values.
+
+        """
+        values = np.asarray(values, dtype=float)
+        is_nan = np.isnan(values)
+        self.nan_count += np.count_nonzero(is_nan)
+        values = values[~is_nan]
+        if len(values) == 0:
+            return
+
+        mean = values.mean()
+        self._merge_moments(len(values), mean, np.sum((values - mean) ** 2))
+        self.minimum = min(self.minimum, values.min())
+        self.maximum = max(self.maximum, values.max())
+        self.histogram += np.bincount(np.searchsorted(self.histogram_edges, values, side='right'),
+                                      minlength=len(self.histogram))[:len(self.histogram)]
+        # the upper edge belongs to the last bin, like in numpy.histogram
+        self.histogram[-1] -= np.count_nonzero(values == self.histogram_edges[-1])
+        self.histogram[-2] += np.count_nonzero(values == self.histogram_edges[-1])
+        self.sketch.add(values)
+
+    def merge(self, other):
+        """
+        Add the statistics of another batch of values (with the same histogram bins) to these statistics.
+
+        :param other: MeasureStatistics.
+
+        """
+        if not np.array_equal(self.histogram_edges, other.histogram_edges):
+            raise ValueError('Statistics with different histogram bins cannot be merged')
+        self.nan_count += other.nan_count
+        if other.count == 0:
+            return
+        self._merge_moments(other.count, other.mean, other.m2)
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.histogram += other.histogram
+        self.sketch.merge(other.sketch)
+
+    def to_dict(self):
+        """
+        Contents of the statistics as a json compatible dictionary, see from_dict.
+        """
+        return OrderedDict([('count', int(self.count)),
+                            ('nan_count', int(self.nan_count)),
+                            ('mean', float(self.mean)),
+                            ('m2', float(self.m2)),
+                            ('minimum', float(self.minimum)),
+                            ('maximum', float(self.maximum)),
+                            ('histogram_edges', self.histogram_edges.tolist()),
+                            ('histogram', self.histogram.tolist()),
+                            ('sketch', self.sketch.to_dict())])
+
+    @classmethod
+    def from_dict(cls, contents):
+        """
+        Make statistics from the contents stored with to_dict.
+        """
+        statistics = cls()
+        statistics.count = contents['count']
+        statistics.nan_count = contents['nan_count']
+        statistics.mean = contents['mean']
+        statistics.m2 = contents['m2']
+        statistics.minimum = contents['minimum']
+        statistics.maximum = contents['maximum']
+        statistics.histogram_edges = np.array(contents['histogram_edges'])
+        statistics.histogram = np.array(contents['histogram'], dtype=np.int64)
+        statistics.sketch = QuantileSketch.from_dict(contents['sketch'])
+        return statistics
+
+    def _merge_moments(self, count, mean, m2):
+        # parallel version of Welford's algorithm (Chan et al.), for a batch of @count values with @mean and @m2
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+
+class EventStatistics(object):
+    """
+    Running statistics of the events of any number of trials, per event type (see SUMMARY_MEASURES).
+    """
+    def __init__(self):
+        self.trials = 0
+        self.measures = OrderedDict()
+        for event_type, measures in SUMMARY_MEASURES.items():
+            for measure in measures:
+                self.measures[(event_type, measure)] = MeasureStatistics(HISTOGRAM_RANGES[measure])
+
+    def add(self, tables):
+        """
+        Add the events of a trial.
+
+        :param tables: list of EventTable objects of the trial (e.g. its fixations, saccades, pursuits and blinks).
+
+        """
+        for table in tables:
+            for measure in SUMMARY_MEASURES.get(table.event_type, []):
+                self.measures[(table.event_type, measure)].add(table[measure])
+        self.trials += 1
+
+    def merge(self, other):
+        """
+        Add the statistics of other trials, e.g. of another participant or computed by another process.
+
+        :param other: EventStatistics.
+
+        """
+        for key, statistics in other.measures.items():
+            self.measures[key].merge(statistics)
+        self.trials += other.trials
+
+    def to_dict(self):
+        """
+        Contents of the statistics as a json compatible dictionary, e.g. to store the statistics of a trial with its
+        results, see from_dict.
+        """
+        return OrderedDict([('trials', self.trials),
+                            ('measures', [[event_type, measure, statistics.to_dict()]
+                                          for (event_type, measure), statistics in self.measures.items()])])
+
+    @classmethod
+    def from_dict(cls, contents):
+        """
+        Make statistics from the contents stored with to_dict.
+
+        :param contents: dictionary made by to_dict.
+        :return: EventStatistics.
+
+        """
+        statistics = cls()
+        statistics.trials = contents['trials']
+        for event_type, measure, measurestatistics in contents['measures']:
+            statistics.measures[(event_type, measure)] = MeasureStatistics.from_dict(measurestatistics)
+        return statistics
+
+    def summary(self):
+        """
+        Summary table of the statistics.
+
+        :return: pandas DataFrame with a row per event type and measure.
+
+        """
+        rows = []
+        for (event_type, measure), statistics in self.measures.items():
+            row = OrderedDict([('event', labels.EVENTS[event_type]),
+                               ('measure', measure),
+                               ('count', statistics.count),
+                               ('nan_count', statistics.nan_count),
+                               ('mean', statistics.mean if statistics.count > 0 else np.nan),
+                               ('std', statistics.std),
+                               ('min', statistics.minimum if statistics.count > 0 else np.nan),
+                               ('max', statistics.maximum if statistics.count > 0 else np.nan)])
+            for q in SUMMARY_QUANTILES:
+                row['q{:g}'.format(100 * q)] = statistics.sketch.quantile(q)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def histogram(self, event_type, measure):
+        """
+        Histogram of a measure.
+
+        :param event_type: label code of the events.
+        :param measure: name of the measure.
+        :return: tuple of the bin edges and the counts of the values below the first edge, in each bin and above
+                 the last edge.
+
+        """
+        statistics = self.measures[(event_type, measure)]
+        return statistics.histogram_edges, statistics.histogram
@@ -0,0 +1,175 @@
+import numpy as np
+import labels
+
+"""
+Column based table of detected gaze events.
+
+An EventTable holds the events of one type (a label code, see labels.py) as the sample index range of every event
+in the recording, together with (views on) the columns of the recording. All measures of the events, such as their
+duration, amplitude and velocities, are named columns that are computed on first access and cached, so code that
+only reads a few measures only pays for those.
+The start index of an event is its first sample, the end index the first sample after it (or the last sample of the
+recording, for an event that lasts until the end), see calculators.event_runs.
+"""
+
+# measures that are saved and shown for every event type (the former positional table columns)
+EVENT_COLUMNS = {labels.FIX: ['t_start', 't_end', 'duration', 'x_pos', 'y_pos'],
+                 labels.SACCADE: ['t_start', 't_end', 'duration', 'x_start', 'y_start', 'x_end', 'y_end',
+                                  'amplitude', 'mean_vel', 'max_vel'],
+                 labels.SP: ['t_start', 't_end', 'duration', 'x_start', 'y_start', 'x_end', 'y_end',
+                             'amplitude', 'mean_vel', 'max_vel'],
+                 labels.BLINK: ['t_start', 't_end', 'duration']}
+# all measures that can be computed, and the recording columns they need
+MEASURES = {'t_start': ('time',),
+            't_end': ('time',),
+            'duration': ('time',),
+            'x_start': ('x',),
+            'y_start': ('y',),
+            'x_end': ('x',),
+            'y_end': ('y',),
+            'x_pos': ('x',),
+            'y_pos': ('y',),
+            'amplitude': ('x', 'y'),
+            'mean_vel': ('v',),
+            'max_vel': ('v',),
+            'dispersion': ('x', 'y')}
+
+
+class EventTable(object):
+    """
+    Table of the gaze events of one type.
+
+    The measures are available by name, as table['duration'] or table.duration, the index ranges as
+    table.start_index and table.end_index. The recording columns (time, x, y, v) that are not given cannot be
+    used for measures.
+    """
+    def __init__(self, event_type, start_index, end_index, time=None, x=None, y=None, v=None):
+        self.event_type = event_type
+        self.start_index = np.asarray(start_index)
+        self.end_index = np.asarray(end_index)
+        self.recording = {'time': time, 'x': x, 'y': y, 'v': v}
+        self._measures = dict()
+
+    @classmethod
+    def from_runs(cls, event_type, runs, time=None, x=None, y=None, v=None):
+        """
+        Create the table of the events of one type from the events of all labels.
+
+        :param event_type: label code of the events.
+        :param runs: start and end indices of the events of every label, see calculators.event_runs.
+        :param time: timestamps of the samples.
+        :param x: horizontal gaze angles of the samples.
+        :param y: vertical gaze angles of the samples.
+        :param v: velocities of the samples.
+        :return: EventTable.
+
+        """
+        starts, ends = runs[event_type]
+        return cls(event_type, starts, ends, time=time, x=x, y=y, v=v)
+
+    @property
+    def columns(self):
+        """
+        Names of the measures that are saved and shown for this event type.
+        """
+        return EVENT_COLUMNS[self.event_type]
+
+    def __len__(self):
+        return len(self.start_index)
+
+    def __getitem__(self, name):
+        if name not in MEASURES:
+            raise KeyError('Unknown event measure {}'.format(name))
+        if name not in self._measures:
+            for column in MEASURES[name]:
+                if self.recording[column] is None:
+                    raise ValueError('The measure {} needs the {} column of the recording'.format(name, column))
+            self._measures[name] = getattr(self, '_compute_' + name)()
+        return self._measures[name]
+
+    def __getattr__(self, name):
+        if name in MEASURES:
+            return self[name]
+        raise AttributeError(name)
+
+    def __array__(self, dtype=None, copy=None):
+        # e.g. numpy.asarray(table) gives the positional table of the calculators of earlier versions
+        array = self.to_array()
+        return array if dtype is None else array.astype(dtype)
+
+    def to_array(self, columns=None):
+        """
+        Stack the measures into a 2D array, with a row per event.
+
+        :param columns: names of the measures, by default self.columns.
+        :return: numpy array, or an empty array if there are no events.
+
+        """
+        if len(self) == 0:
+            return np.array([])
+        return np.column_stack([self[name] for name in (self.columns if columns is None else columns)])
+
+    def _compute_t_start(self):
+        return self.recording['time'][self.start_index]
+
+    def _compute_t_end(self):
+        return self.recording['time'][self.end_index]
+
+    def _compute_duration(self):
+        return self['t_end'] - self['t_start']
+
+    def _compute_x_start(self):
+        return self.recording['x'][self.start_index]
+
+    def _compute_y_start(self):
+        return self.recording['y'][self.start_index]
+
+    def _compute_x_end(self):
+        return self.recording['x'][self.end_index]
+
+    def _compute_y_end(self):
+        return self.recording['y'][self.end_index]
+
+    def _compute_x_pos(self):
+        # the position of a fixation is the mean of the positions at its start and end index
+        return (self['x_start'] + self['x_end']) / 2
+
+    def _compute_y_pos(self):
+        return (self['y_start'] + self['y_end']) / 2
+
+    def _compute_amplitude(self):
+        return np.hypot(self['x_start'] - self['x_end'], self['y_start'] - self['y_end'])
+
+    def _compute_mean_vel(self):
+        # mean of the velocities of the samples from the start up to (not including) the end index
+        v = self.recording['v']
+        if len(self) == 0:
+            return np.zeros(0, dtype=v.dtype)
+        counts = self.end_index - self.start_index
+        sums = np.add.reduceat(v, np.column_stack([self.start_index, self.end_index]).ravel())[::2]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_vel = sums / counts.astype(sums.dtype)
+        mean_vel[counts == 0] = np.nan
+        return mean_vel
+
+    def _compute_max_vel(self):
+        v = self.recording['v']
+        if len(self) == 0:
+            return np.zeros(0, dtype=v.dtype)
+        maxima = np.fmax.reduceat(v, np.column_stack([self.start_index, self.end_index]).ravel())[::2]
+        # like the built-in max, the maximum is nan if the first velocity is nan (other nan values are skipped)
+        maxima[np.isnan(v[self.start_index]) | (self.end_index == self.start_index)] = np.nan
+        return maxima
+
+    def _compute_dispersion(self):
+        # largest of the horizontal and vertical spread (maximum - minimum) of the samples of every event
+        x = self.recording['x']
+        y = self.recording['y']
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.result_type(x, y))
+        bounds = np.column_stack([self.start_index, self.end_index]).ravel()
+        spread_x = (np.maximum.reduceat(x, bounds) - np.minimum.reduceat(x, bounds))[::2]
+        spread_y = (np.maximum.reduceat(y, bounds) - np.minimum.reduceat(y, bounds))[::2]
+        dispersion = np.maximum(spread_x, spread_y)
+        dispersion[self.end_index == self.start_index] = np.nan
+        return dispersion
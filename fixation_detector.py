@@ -1,10 +1,8 @@
 import copy
-import math
 import numpy as np
-from arff import xrange
 
 import functions
-from arff_helper import ArffHelper
+import labels
 
 def FixationDetector(param, gaze_points, inplace=False):
     """
@@ -32,42 +30,42 @@ def FixationDetector(param, gaze_points, inplace=False):
     """
     if not inplace:
         gaze_points = copy.deepcopy(gaze_points)
-    # add a global index column (to keep track of where we are even if working within an intersaccadic interval)
-    gaze_points = ArffHelper.add_column(gaze_points, name='global_index', dtype='INTEGER', default_value=-1)
-    gaze_points['data']['global_index'] = np.arange(gaze_points['data'].shape[0])
-
     # I. First step of fixation removal: rough prefiltering
     speed_thd = param["SPEED_THRESHOLD_DEGREES_PER_SEC"]
     prefiltering_spread_thd = param["PREFILTERING_INTERVAL_SPREAD_THRESHOLD_DEGREES"]
 
-    # record intersaccadic interval indices of those intervals that are not labelled as FIX by the prefiltering
-    unknown_interval_index = []
-    unknown_interval_masks = []
-    for i in xrange(max(gaze_points['data']['INTERSACC_INTERVAL_INDEX']) + 1):
-        mask = gaze_points['data']['INTERSACC_INTERVAL_INDEX'] == i
-        intersacc_interval = gaze_points['data'][mask]
-        if len(intersacc_interval) == 0:
-            continue
-
-        dispersion = [max(intersacc_interval['x']) - min(intersacc_interval['x']),
-                      max(intersacc_interval['y']) - min(intersacc_interval['y'])]
-
-        if any(thd >= prefiltering_spread_thd for thd in dispersion):
-            unknown_interval_index.append(i)  # keep unknown
-            unknown_interval_masks.append(mask.copy())  # cache the indexing
-        else:
-            gaze_points['data']['EYE_MOVEMENT_TYPE'][mask] = 'FIX'
+    # group the samples by their intersaccadic interval (an interval can be split by blinks), the samples of every
+    # interval stay in their original order
+    interval_indices = gaze_points['data']['INTERSACC_INTERVAL_INDEX']
+    interval_samples = np.nonzero(interval_indices >= 0)[0]
+    interval_samples = interval_samples[np.argsort(interval_indices[interval_samples], kind='stable')]
+    grouped_indices = interval_indices[interval_samples]
+    interval_starts = np.nonzero(np.diff(grouped_indices, prepend=-1))[0]
+
+    # dispersion of every interval, computed with grouped reductions
+    grouped_x = gaze_points['data']['x'][interval_samples]
+    grouped_y = gaze_points['data']['y'][interval_samples]
+    dispersion_x = np.maximum.reduceat(grouped_x, interval_starts) - np.minimum.reduceat(grouped_x, interval_starts)
+    dispersion_y = np.maximum.reduceat(grouped_y, interval_starts) - np.minimum.reduceat(grouped_y, interval_starts)
+    is_unknown = (dispersion_x >= prefiltering_spread_thd) | (dispersion_y >= prefiltering_spread_thd)
+
+    # label the samples of the compact intervals as FIX
+    interval_lengths = np.diff(np.hstack([interval_starts, [len(interval_samples)]]))
+    gaze_points['data']['EYE_MOVEMENT_TYPE'][interval_samples[np.repeat(~is_unknown, interval_lengths)]] = labels.FIX
+
+    # record the samples of those intervals that are not labelled as FIX by the prefiltering
+    unknown_interval_samples = [samples for samples, unknown in
+                                zip(np.split(interval_samples, interval_starts[1:]), is_unknown) if unknown]
 
     # II. Second step of fixation removal: finer prefiltering
     #
+    # samples are looked up by their timestamp in the whole recording, with a binary search if its time column is sorted
+    recording_times = gaze_points['data']['time']
+    recording_times_sorted = bool(np.all(recording_times[1:] >= recording_times[:-1]))
 
-    for i, interval_mask in zip(unknown_interval_index, unknown_interval_masks):
-        # We record the borders of the non-FIX episodes to validate their duration. If the non-FIX episode is very
-        # short, we mark it as NOISE (not enough duration for a candidate for smooth pursuit)
-        onset_timestamp = None
-        onset_index = None
-
-        intersacc_interval = gaze_points['data'][interval_mask]
+    for global_indices in unknown_interval_samples:
+        # global indices of the interval samples (to keep track of where we are in the whole recording)
+        intersacc_interval = gaze_points['data'][global_indices]
         intersacc_interval = functions.get_xy_moving_average(intersacc_interval,
                         param["NORMALIZATION_SLIDING_WINDOW_SIZE_SAMPLES"],
                         inplace=False)
@@ -80,90 +78,156 @@ def FixationDetector(param, gaze_points, inplace=False):
 
         # for intervals that longer than param["SLIDING_WINDOW_WIDTH_MILLISEC"] do further pre-filtering.
         # Label data as 'FIX' or 'NOISE', or keep 'UNKNOWN'
-        else:
-            # window is shifted by 1 sample every time
-            for index, item in enumerate(intersacc_interval):
-                x_start = item['x']
-                y_start = item['y']
-                shift_window_interval = intersacc_interval[
-                    (intersacc_interval['time'] >= item['time']) *
-                    (intersacc_interval['time'] <= item['time'] + param["SLIDING_WINDOW_WIDTH_MILLISEC"])
-                ]
-
-                # if distance between current data and the end of interval is shorter than
-                # param["SLIDING_WINDOW_WIDTH_MILLISEC"](i.e. if the end of the window matches the end of the
-                # intersaccadic interval), we keep the previous label if it was FIX, otherwise keep UNKNOWN
-                if shift_window_interval['time'][-1] == intersacc_interval['time'][-1]:
-                    if intersacc_interval['EYE_MOVEMENT_TYPE'][index - 1] == 'FIX':
-                        gaze_points['data']['EYE_MOVEMENT_TYPE'][
-                            (gaze_points['data']['time'] == item['time'])] = 'FIX'
-
-                        # we do not keep track of the non-fixation interval anymore since it will be all fixation
-                        # until the end of the intersaccadic interval
-                        onset_timestamp = None
-                        onset_index = None
-                    else:
-                        # new non-fixation interval is starting
-                        onset_timestamp = item['time']
-                        onset_index = item['global_index']
-
-                # if distance between current data and the end of interval is larger than window size, continue
-                # with the process
-                else:
-                    # get window duration in seconds
-                    period = (shift_window_interval['time'][-1] - shift_window_interval['time'][0]) * 1e-6
-
-                    # is the fixation criterion satisfied?
-                    fixation_flag = True
-                    if param["SLIDING_WINDOW_CRITERION"] == 'speed':
-                        # if the current speed is larger than speed threshold --
-                        # mark as onset(UNKNOWN, NOISE). else -- mark as offset(FIX)
-                        x_end = shift_window_interval['x'][-1]
-                        y_end = shift_window_interval['y'][-1]
-
-                        if math.sqrt((x_start - x_end) ** 2 + (y_start - y_end) ** 2) >= speed_thd * period:
-                            # will not be a fixation
-                            fixation_flag = False
-                    else:  # spread
-                        # if either x_max - x_min or y_max - y_min is larger than speed threshold * time --
-                        # mark as onset. else -- mark as offset
-                        x_max = max(shift_window_interval['x'])
-                        x_min = min(shift_window_interval['x'])
-                        y_max = max(shift_window_interval['y'])
-                        y_min = min(shift_window_interval['y'])
-
-                        if max(x_max - x_min, y_max - y_min) >= speed_thd * period:
-                            # will not be a fixation
-                            fixation_flag = False
-
-                    if fixation_flag:
-                        gaze_points['data']['EYE_MOVEMENT_TYPE'][item['global_index']] = 'FIX'
-
-                    # either a fixation start or the whole interval end
-                    if fixation_flag or index == len(intersacc_interval) - 1:
-                        # if we had a non-fixation interval going on before, check it's duration
-                        if onset_index is not None:
-                            # onset episode larger than 50ms: UNKNOWN. else: NOISE
-                            if item['time'] - onset_timestamp < param["MIN_SP_DURATION_MILLISEC"]:
-                                offset_timestamp = item['time'] - 1
-                                offset_index = item['global_index'] - 1
-                                # if this is not the beginning of fixation,
-                                # the last item also should be labelled as NOISE
-                                if not fixation_flag:
-                                    offset_timestamp += 1
-                                    offset_index += 1
-
-                                gaze_points['data'][onset_index:(offset_index + 1)]['EYE_MOVEMENT_TYPE'] = 'NOISE'
-
-                            # episode is finished
-                            onset_timestamp = None
-                            onset_index = None
-                    else:
-                        # if new non-fixation interval started
-                        if onset_timestamp is None:
-                            onset_timestamp = item['time']
-                            onset_index = item['global_index']
-                        # otherwise it just continues, don't have to do anything
-    # can now remove the global_index column
-    gaze_points = ArffHelper.remove_column(gaze_points, 'global_index')
+        times = np.ascontiguousarray(intersacc_interval['time'])
+        x = intersacc_interval['x']
+        y = intersacc_interval['y']
+
+        # window is shifted by 1 sample every time, it holds the samples from the current one to
+        # param["SLIDING_WINDOW_WIDTH_MILLISEC"] later
+        window_start, window_end = _window_bounds(times, param["SLIDING_WINDOW_WIDTH_MILLISEC"])
+
+        # if distance between current data and the end of interval is shorter than
+        # param["SLIDING_WINDOW_WIDTH_MILLISEC"](i.e. if the end of the window matches the end of the
+        # intersaccadic interval), the fixation criterion is not evaluated
+        at_interval_end = times[window_end] == times[-1]
+
+        # get window duration in seconds
+        period = (times[window_end] - times[window_start]) * 1e-6
+
+        # is the fixation criterion satisfied?
+        if param["SLIDING_WINDOW_CRITERION"] == 'speed':
+            # if the current speed is larger than speed threshold --
+            # mark as onset(UNKNOWN, NOISE). else -- mark as offset(FIX)
+            distance = np.sqrt(((x - x[window_end]) ** 2 + (y - y[window_end]) ** 2).astype(np.float64))
+            # compared at the precision of the timestamps
+            fixation_flag = ~(distance.astype(times.dtype) >= speed_thd * period)
+        else:  # spread
+            # if either x_max - x_min or y_max - y_min is larger than speed threshold * time --
+            # mark as onset. else -- mark as offset
+            spread = _window_spread(x, y, times, window_start, window_end, param["SLIDING_WINDOW_WIDTH_MILLISEC"])
+            fixation_flag = ~(spread >= speed_thd * period)
+        fixation_flag &= ~at_interval_end
+
+        _label_episodes(gaze_points, intersacc_interval['EYE_MOVEMENT_TYPE'], times, global_indices,
+                        fixation_flag, at_interval_end, param["MIN_SP_DURATION_MILLISEC"], recording_times_sorted)
+
     return gaze_points
+
+def _window_bounds(times, width):
+    """
+    Find the sliding window of every sample: all samples with a timestamp from the one of the sample up to @width
+    later. The window of a sample is represented by its first and last sample.
+
+    :param times: timestamps of the samples in the interval.
+    :param width: width of the window [ms].
+    :return: tuple of the index of the first and of the last sample of the window of every sample.
+
+    """
+    if np.all(times[1:] >= times[:-1]):
+        # sorted timestamps: the windows are contiguous
+        window_start = np.searchsorted(times, times, side='left')
+        window_end = np.searchsorted(times, times + width, side='right') - 1
+        return window_start, window_end
+
+    window_start = np.empty(len(times), dtype=int)
+    window_end = np.empty(len(times), dtype=int)
+    for index in range(len(times)):
+        in_window = np.nonzero((times >= times[index]) * (times <= times[index] + width))[0]
+        window_start[index] = in_window[0]
+        window_end[index] = in_window[-1]
+    return window_start, window_end
+
+def _window_spread(x, y, times, window_start, window_end, width):
+    """
+    Largest of the horizontal and vertical spread (maximum - minimum) of the samples in the sliding window of every
+    sample, see _window_bounds.
+
+    :param x: horizontal positions of the samples in the interval.
+    :param y: vertical positions of the samples in the interval.
+    :param times: timestamps of the samples in the interval.
+    :param window_start: index of the first sample of the window of every sample.
+    :param window_end: index of the last sample of the window of every sample.
+    :param width: width of the window [ms].
+    :return: spread of the window of every sample.
+
+    """
+    if np.all(times[1:] >= times[:-1]):
+        # sorted timestamps: the windows are contiguous, use the sliding window extrema
+        x_min, x_max = functions.get_sliding_window_extrema(x, window_start, window_end)
+        y_min, y_max = functions.get_sliding_window_extrema(y, window_start, window_end)
+        return np.maximum(x_max - x_min, y_max - y_min)
+
+    spread = np.empty(len(times), dtype=x.dtype)
+    for index in range(len(times)):
+        in_window = (times >= times[index]) * (times <= times[index] + width)
+        spread[index] = max(x[in_window].max() - x[in_window].min(), y[in_window].max() - y[in_window].min())
+    return spread
+
+def _label_episodes(gaze_points, interval_labels, times, global_indices, fixation_flag, at_interval_end,
+                    min_sp_duration, recording_times_sorted=False):
+    """
+    Label the samples of an intersaccadic interval that satisfy the fixation criterion as FIX, and the non-fixation
+    episodes between them that are shorter than @min_sp_duration as NOISE.
+
+    The samples are handled in runs of samples of the same kind (fixation, non-fixation, or at the end of the
+    interval), in the order of the interval:
+    - a non-fixation episode starts at the first non-fixation sample after a fixation sample,
+    - it is finished by the next fixation sample, or by the last sample of the interval,
+    - at the end of the interval every sample starts a new episode, unless the sample before it was labelled FIX
+      (then all samples at its timestamp become FIX). Those episodes are not finished anymore.
+
+    :param gaze_points: arff object of the recording, labelled in place.
+    :param interval_labels: labels of the interval samples before this step.
+    :param times: timestamps of the interval samples.
+    :param global_indices: indices of the interval samples in the recording.
+    :param fixation_flag: whether every sample satisfies the fixation criterion.
+    :param at_interval_end: whether the window of every sample reaches the end of the interval.
+    :param min_sp_duration: minimal duration of a non-fixation episode to not be labelled as NOISE [ms].
+    :param recording_times_sorted: whether the time column of the whole recording is sorted.
+
+    """
+    last = len(times) - 1
+    # 0: non-fixation, 1: fixation, 2: end of the interval
+    kind = fixation_flag.astype(int) + 2 * at_interval_end
+    run_starts = np.nonzero(np.diff(kind, prepend=-1))[0]
+    run_ends = np.hstack([run_starts[1:], [len(kind)]]) - 1
+
+    # onset of the current non-fixation episode
+    onset_index = None
+    for start, end in zip(run_starts, run_ends):
+        if kind[start] == 1:
+            gaze_points['data']['EYE_MOVEMENT_TYPE'][global_indices[start:end + 1]] = labels.FIX
+            # a fixation start: if we had a non-fixation interval going on before, check it's duration
+            if onset_index is not None:
+                # onset episode larger than 50ms: UNKNOWN. else: NOISE
+                if times[start] - times[onset_index] < min_sp_duration:
+                    gaze_points['data'][global_indices[onset_index]:global_indices[start]]['EYE_MOVEMENT_TYPE'] = \
+                        labels.NOISE
+                # episode is finished
+                onset_index = None
+        elif kind[start] == 0:
+            # if new non-fixation interval started
+            if onset_index is None and start < last:
+                onset_index = start
+            # the whole interval end
+            if end == last and onset_index is not None:
+                if times[last] - times[onset_index] < min_sp_duration:
+                    # the last item also should be labelled as NOISE
+                    gaze_points['data'][global_indices[onset_index]:global_indices[last] + 1]['EYE_MOVEMENT_TYPE'] = \
+                        labels.NOISE
+                onset_index = None
+        else:
+            # we keep the previous label if it was FIX, otherwise a new non-fixation interval is starting
+            keep = interval_labels[np.arange(start, end + 1) - 1] == labels.FIX
+            # all samples of the recording at the timestamps of the kept samples
+            recording_times = gaze_points['data']['time']
+            kept_times = times[start:end + 1][keep]
+            if recording_times_sorted:
+                first = np.searchsorted(recording_times, kept_times, side='left')
+                counts = np.searchsorted(recording_times, kept_times, side='right') - first
+                samples = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+                gaze_points['data']['EYE_MOVEMENT_TYPE'][samples] = labels.FIX
+            else:
+                for kept_time in kept_times:
+                    gaze_points['data']['EYE_MOVEMENT_TYPE'][recording_times == kept_time] = labels.FIX
+            onset_index = None if keep[-1] else end
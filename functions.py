@@ -1,6 +1,6 @@
 import numpy as np
 import pandas as pd
-from arff_helper import ArffHelper
+from gaze_recording import GazeRecording
 from collections import OrderedDict
 
 """
@@ -38,45 +38,20 @@ def load_CSV_as_arff_object(x, y, t, s, fname):
     >> arff_obj = ArffHelper.convert_data_to_structured_array(arff_obj)
     to (unsurprisingly) convert the data in @arff_obj['data'] into a structured numpy array for easier data access.
 
+    Here the columns are already numpy arrays, so they are stored in a GazeRecording (one array per column) and
+    converted to the arff object from there, without going through a tuple per sample.
+
+    :param x: horizontal gaze angles [deg].
+    :param y: vertical gaze angles [deg].
+    :param t: time stamps [ms].
+    :param s: status of each sample.
     :param fname: name of .csv file.
     :return: an arff object with keywords:
              "@RELATION, @DESCRIPTION, @DATA, @ATTRIBUTES".
     """
-
-    COMMENT_PREFIX = '#'
-    # the 'gaze ... ...' line has this many "fields" (defines the video resolution)
-    GAZE_FORMAT_FIELD_COUNT = 0
-    # Samples are in lines that look like <timestamp> <x> <y> <confidence>.
-    # In case of binocular tracking, these are the mean coordinates of the two eyes anyway.
-    GAZE_SAMPLE_FIELDS = 3
-
-    arff_obj = {
-        'relation': 'gaze_recording',
-        'description': [],
-        'data': [],
-        'metadata': OrderedDict(),
-        'attributes': [('time', 'NUMERIC'),
-                       ('x', 'NUMERIC'),
-                       ('y', 'NUMERIC'),
-                       ('status', 'INTEGER')]
-    }
-
-    description = ""
-    data = np.array([t, x, y, s])
-    arff_obj['data'] = np.array([tuple(item) for item in np.transpose(data)])
-    arff_obj['metadata']['filename'] = fname
-    arff_obj['description'] = '\n'.join(description)
-
-    arff_obj = ArffHelper.convert_data_to_structured_array(arff_obj)
-
-    # add velocity type attribute
-    arff_obj = ArffHelper.add_column(arff_obj, 'v', 'NUMERIC', 0.0)
-
-    # add eye movement type attribute
-    EVENTS = ('UNKNOWN', 'FIX', 'SACCADE', 'SP', 'NOISE', 'BLINK', 'NOISE_CLUSTER', 'PSO')
-    arff_obj = ArffHelper.add_column(arff_obj, 'EYE_MOVEMENT_TYPE', EVENTS, EVENTS[0])
-
-    return arff_obj
+    # the velocity ('v'), eye movement type ('EYE_MOVEMENT_TYPE') and the attributes the detectors fill are added with
+    # default values, so that the data is allocated once for the whole detection
+    return GazeRecording.from_columns(x, y, t, s, fname).to_arff()
 
 def get_xy_moving_average(data, window_size, inplace=False):
     """
@@ -108,6 +83,54 @@ def get_xy_moving_average(data, window_size, inplace=False):
             data[column][:] = res
     return data
 
+def get_sliding_window_extrema(values, window_start, window_end):
+    """
+    Get the minimum and maximum of @values in a window around every sample, e.g. the windows of a time based sliding
+    window over irregularly spaced samples.
+
+    The extrema of all windows of 2^k samples are computed level by level (a sparse table), every window is then
+    covered by two (overlapping) windows of the largest power of two that fits in it. This takes
+    O(n log(longest window)) vectorized operations, instead of a reduction per window.
+
+    :param values: numpy array of values.
+    :param window_start: index of the first sample of the window of every sample.
+    :param window_end: index of the last sample of the window of every sample (not smaller than @window_start).
+    :return: tuple of numpy arrays with the minimum and the maximum of every window.
+
+    """
+    values = np.asarray(values)
+    window_start = np.asarray(window_start)
+    window_end = np.asarray(window_end)
+    minima = np.empty(len(window_start), dtype=values.dtype)
+    maxima = np.empty(len(window_start), dtype=values.dtype)
+    if len(window_start) == 0:
+        return minima, maxima
+
+    # level of every window: the largest k with 2^k <= window length
+    lengths = window_end - window_start + 1
+    window_level = np.zeros(len(lengths), dtype=int)
+    levels = int(lengths.max()).bit_length()
+    for level in range(1, levels):
+        window_level[lengths >= 2 ** level] = level
+
+    level_minima = values
+    level_maxima = values
+    for level in range(levels):
+        if level > 0:
+            # extrema of the windows of 2^level samples starting at every sample
+            half = 2 ** (level - 1)
+            level_minima = np.minimum(level_minima[:-half], level_minima[half:])
+            level_maxima = np.maximum(level_maxima[:-half], level_maxima[half:])
+        at_level = window_level == level
+        if not np.any(at_level):
+            continue
+        first = window_start[at_level]
+        second = window_end[at_level] - 2 ** level + 1
+        minima[at_level] = np.minimum(level_minima[first], level_minima[second])
+        maxima[at_level] = np.maximum(level_maxima[first], level_maxima[second])
+
+    return minima, maxima
+
 def fill_blink_gaps(data):
     """
     Find gaps in the data that represent blinks, for recordings with Varjo Base.
@@ -116,51 +139,44 @@ def fill_blink_gaps(data):
     Varjo base does not record any data during a blink, so instead a jump in time-interval is found.
     This function detects those gaps in the data and fills them with zero arrays for blink detection.
 
+    The sizes of all patches are computed up front, so the patched data is allocated once and the original rows are
+    scattered into it, which keeps this linear in the length of the recording.
+
     :param data: gazedata read from the .csv
 
     :return: patched data set with added interpolations where blinks occured
 
     """
-    t = data['raw_timestamp'] / 10 ** 6
-    t = np.array(t - t[0])
+    t = np.asarray(data['raw_timestamp']) / 10 ** 6
+    t = t - t[0]
     s = data['status']
 
     # find blinks for Varjo base recording by gaps in time array
     dt = np.diff(t)
     blink_onsets = np.nonzero(dt > 30)[0]
-    blink_offsets = np.array([blink + 1 for blink in blink_onsets])
 
     #interpolate for each gap the x, y ,t and s data
     if min(s) != 0:
-        shift = 0
-        for onset, offset in zip(blink_onsets, blink_offsets):
-            onset  += shift
-            offset += shift
-            t = data['raw_timestamp'] / 10 ** 6
-            t = np.array(t - t[0])
-            gaptime = t[offset] - t[onset]
-            npoints = int(gaptime/dt.mean())
-
-            # create patch
-            datapatch  = pd.DataFrame(np.zeros([npoints, len(data.columns)]), columns=data.columns)
-
-            # append the patches in the data arrays            data[:onset+1].append()
-            past_data = data[:(onset+1)]
-            future_data = data[offset:]
-            inserted_data = past_data.append(datapatch, ignore_index=True)
-            data = inserted_data.append(future_data, ignore_index=True)
-            # shift indexes with patch length
-            shift += npoints
+        if len(blink_onsets) > 0:
+            # number of zero samples that is inserted after the onset of each gap
+            patch_sizes = (dt[blink_onsets] / dt.mean()).astype(int)
+
+            # every sample after a gap is shifted by the total length of the preceding patches
+            shift = np.zeros(len(data), dtype=int)
+            shift[blink_onsets + 1] = patch_sizes
+            positions = np.arange(len(data)) + np.cumsum(shift)
+
+            patched_data = OrderedDict()
+            for column in data.columns:
+                values = data[column].to_numpy()
+                patched_data[column] = np.zeros(len(data) + patch_sizes.sum(), dtype=values.dtype)
+                patched_data[column][positions] = values
+            data = pd.DataFrame(patched_data)
 
         # fix time vector by replacing zeros with NaN and interpolating
-        raw_times = data['raw_timestamp']
-        raw_times[raw_times==0] = np.nan
-        data['raw_timestamp'] = raw_times.interpolate()
-
-        if 'relative_to_video_first_frame_timestamp' in data.columns:
-            raw_video_times = data['relative_to_video_first_frame_timestamp']
-            raw_video_times[raw_video_times == 0] = np.nan
-            data['relative_to_video_first_frame_timestamp'] = raw_video_times.interpolate()
+        for column in ['raw_timestamp', 'relative_to_video_first_frame_timestamp']:
+            if column in data.columns:
+                data[column] = data[column].mask(data[column] == 0).interpolate()
 
     return data
 
@@ -170,14 +186,12 @@ def save_events(data, fname, datapath):
         Each row of the csv, is one gaze event. It includes measures such as :
         ["t_start", 't_end', 'duration', 'x_start', 'y_start', 'x_end', 'y_end', 'amplitude', 'mean_vel', 'max_vel']
 
-        :param data: data to save in the .csv
+        :param data: EventTable with the events to save in the .csv, its columns are saved
         :param fname: filename for the created .csv
         :param datapath: path to save the created .csv
 
     """
-    allnames = ["t_start", 't_end', 'duration', 'x_start', 'y_start', 'x_end', 'y_end', 'amplitude', 'mean_vel', 'max_vel']
-    names = allnames[0:len(data[0, :])]
     delimiter = ','
-    header = delimiter.join(names)
+    header = delimiter.join(data.columns)
 
-    np.savetxt(datapath + '/' + fname, data, delimiter=delimiter, header=header, comments='')
+    np.savetxt(datapath + '/' + fname, data.to_array(), delimiter=delimiter, header=header, comments='')
@@ -0,0 +1,159 @@
+import numpy as np
+from collections import OrderedDict
+import labels
+from arff_helper import ArffHelper
+
+"""
+Column based (struct of arrays) container for a gaze recording.
+
+Every column (time, x, y, v, status, the eye movement labels and any column added by the detectors) is a separate
+contiguous numpy array, so a recording is built from numpy columns with a single conversion per column instead of
+a python tuple per sample. GazeRecording.to_arff and GazeRecording.from_arff convert to and from the arff object
+(dictionary with a structured 'data' array) the detectors work with.
+"""
+
+# possible eye movement labels, stored as their codes (see labels.py)
+EVENTS = labels.EVENTS
+# columns every recording has, with their arff types
+GAZE_ATTRIBUTES = [('time', 'NUMERIC'),
+                   ('x', 'NUMERIC'),
+                   ('y', 'NUMERIC'),
+                   ('status', 'INTEGER'),
+                   ('v', 'NUMERIC'),
+                   ('EYE_MOVEMENT_TYPE', EVENTS)]
+# columns filled by the detectors, declared up front so that the detectors never have to grow the data array
+DETECTION_ATTRIBUTES = GAZE_ATTRIBUTES + [('SACC_INTERVAL_INDEX', 'INTEGER'),
+                                          ('INTERSACC_INTERVAL_INDEX', 'INTEGER'),
+                                          ('CLUSTER_ID', 'NUMERIC')]
+# value of the columns before anything is detected
+DEFAULT_VALUES = {'v': 0.0,
+                  'EYE_MOVEMENT_TYPE': labels.UNKNOWN,
+                  'SACC_INTERVAL_INDEX': -1,
+                  'INTERSACC_INTERVAL_INDEX': -1,
+                  'CLUSTER_ID': -1}
+
+
+class GazeRecording(object):
+    """
+    Gaze recording stored as one array per column.
+
+    The columns are kept in @columns (name -> numpy array) in the order of @attributes (list of (name, arff type)
+    tuples, see ArffHelper), which is also the order of the fields of the arff object made from the recording.
+    The standard columns can be accessed as attributes: time, x, y, v, status and labels (EYE_MOVEMENT_TYPE).
+    """
+    def __init__(self, columns, attributes, relation='gaze_recording', description='', metadata=None):
+        self.columns = OrderedDict(columns)
+        self.attributes = list(attributes)
+        self.relation = relation
+        self.description = description
+        self.metadata = OrderedDict() if metadata is None else OrderedDict(metadata)
+
+    @classmethod
+    def from_columns(cls, x, y, t, s, fname='', attributes=DETECTION_ATTRIBUTES):
+        """
+        Create a recording from the gaze columns. All other columns of @attributes are filled with their
+        DEFAULT_VALUES, i.e. zero velocities, all samples labelled UNKNOWN and no saccades or clusters.
+
+        :param x: horizontal gaze angles [deg].
+        :param y: vertical gaze angles [deg].
+        :param t: time stamps [ms].
+        :param s: status of each sample.
+        :param fname: name of the file the data was read from, stored in the metadata.
+        :param attributes: columns of the recording, by default every column the detectors fill.
+        :return: GazeRecording.
+
+        """
+        gaze = {'time': t, 'x': x, 'y': y, 'status': s}
+        length = len(t)
+        columns = OrderedDict()
+        for name, data_type in attributes:
+            dtype = ArffHelper._convert_dtype_to_numpy(data_type)
+            if name in gaze:
+                columns[name] = np.array(gaze[name], dtype=dtype)
+            else:
+                columns[name] = np.full(length, DEFAULT_VALUES[name], dtype=dtype)
+
+        return cls(columns, attributes, metadata=OrderedDict([('filename', fname)]))
+
+    @classmethod
+    def from_arff(cls, obj, copy=False):
+        """
+        Create a recording from an arff object.
+
+        :param obj: arff object with a structured numpy array as 'data'.
+        :param copy: whether to copy the columns, by default they are views on the fields of @obj['data'].
+        :return: GazeRecording.
+
+        """
+        data = obj['data']
+        columns = OrderedDict()
+        for name, _ in obj['attributes']:
+            columns[name] = data[name].copy() if copy else data[name]
+
+        return cls(columns, obj['attributes'], relation=obj['relation'], description=obj['description'],
+                   metadata=obj['metadata'])
+
+    def to_arff(self):
+        """
+        Convert the recording into an arff object. The structured array is allocated once and filled per column.
+
+        :return: arff object (dictionary with 'relation', 'description', 'data', 'metadata' and 'attributes').
+
+        """
+        dtype = np.dtype([(str(name), ArffHelper._convert_dtype_to_numpy(data_type))
+                          for name, data_type in self.attributes])
+        data = np.empty(len(self), dtype=dtype)
+        for name, _ in self.attributes:
+            data[name] = self.columns[name]
+
+        return {
+            'relation': self.relation,
+            'description': self.description,
+            'data': data,
+            'metadata': OrderedDict(self.metadata),
+            'attributes': list(self.attributes)
+        }
+
+    def add_column(self, name, dtype, default_value):
+        """
+        Add a column filled with @default_value.
+
+        :param name: name of the new column.
+        :param dtype: arff data type of the new column ('NUMERIC', 'REAL', 'INTEGER' or a tuple of strings).
+        :param default_value: value of every sample in the new column.
+
+        """
+        if name in self.columns:
+            raise ValueError('The recording already has a column {}'.format(name))
+        self.columns[name] = np.full(len(self), default_value, dtype=ArffHelper._convert_dtype_to_numpy(dtype))
+        self.attributes.append((name, dtype))
+
+    def __len__(self):
+        return len(self.columns['time'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def time(self):
+        return self.columns['time']
+
+    @property
+    def x(self):
+        return self.columns['x']
+
+    @property
+    def y(self):
+        return self.columns['y']
+
+    @property
+    def v(self):
+        return self.columns['v']
+
+    @property
+    def status(self):
+        return self.columns['status']
+
+    @property
+    def labels(self):
+        return self.columns['EYE_MOVEMENT_TYPE']
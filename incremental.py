@@ -0,0 +1,191 @@
+import os
+import json
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+import cache
+import run_detection
+import event_statistics
+
+"""
+Fingerprints of the results of a trial, so that a batch run only processes the trials whose results are outdated.
+
+The fingerprint of a trial describes everything its results depend on: the content hash of its recording (and of the
+other recordings of the trial in multi observer mode), all detector parameters (run_detection.DetectionParameters),
+a hash of the code that computes the results and the results that were saved. It is stored as fingerprint.json in
+the detection folder of the trial together with the summary statistics of the trial (and the data of its detection
+plot when figures are saved), which is all a batch run needs of a trial it skips.
+The fingerprint is removed before a trial is processed and only written once all its results are saved, so a trial
+that was interrupted by a crash is processed again by the next run.
+"""
+
+FINGERPRINT_FILE = 'fingerprint.json'
+STATISTICS_FILE = 'statistics.json'
+DETECTION_PLOT_FILE = 'detection_plot.npz'
+# increase when the results change in a way the code hash does not capture
+FINGERPRINT_VERSION = 1
+# modules whose code determines the results of a trial
+CODE_MODULES = ['readers', 'cache', 'arff_helper', 'gaze_recording', 'labels', 'saccade_detector', 'blink_detector',
+                'fixation_detector', 'sp_detector', 'run_detection', 'calculators', 'event_table', 'functions',
+                'event_statistics', 'plotters', 'signal_pyramid', 'render_queue', 'pipeline', 'batch']
+
+
+def output_folder(recording):
+    """
+    Folder in which the results of a recording are saved.
+
+    :param recording: recording entry of the manifest.
+    :return: path of the detection folder of the trial.
+
+    """
+    return os.path.join(recording['path'], 'detection')
+
+def code_version():
+    """
+    Hash of the source code of CODE_MODULES.
+
+    :return: hexadecimal sha1 digest.
+
+    """
+    digest = hashlib.sha1()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for module in CODE_MODULES:
+        with open(os.path.join(folder, module + '.py'), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def fingerprint(recordings, settings, previous=None):
+    """
+    Fingerprint of the results of the recordings that are processed together (one, unless in multi observer mode).
+
+    :param recordings: recording entries of the manifest.
+    :param settings: batch settings, see batch.parse_arguments.
+    :param previous: stored fingerprint of the results, its content hashes are reused for recordings with the same
+                     size and modification time, so unchanged recordings are not read again.
+    :return: fingerprint dictionary.
+
+    """
+    known = dict()
+    if previous is not None:
+        known = {recording['file']: recording for recording in previous.get('inputs', [])}
+
+    inputs = []
+    for recording in recordings:
+        stat = os.stat(recording['file'])
+        digest = None
+        entry = known.get(recording['file'])
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            digest = entry['digest']
+        inputs.append(OrderedDict([('file', recording['file']),
+                                   ('size', stat.st_size),
+                                   ('mtime_ns', stat.st_mtime_ns),
+                                   ('digest', digest if digest is not None else cache.file_digest(recording['file']))]))
+
+    # the runtime info of the detectors does not change the results
+    parameters = OrderedDict()
+    for name, param in run_detection.DetectionParameters(multiobserver=settings['multiobserver']).items():
+        parameters[name] = OrderedDict((key, value) for key, value in param.items() if key != 'VERBOSE')
+
+    return OrderedDict([('version', FINGERPRINT_VERSION),
+                        ('inputs', inputs),
+                        ('parameters', parameters),
+                        ('code', code_version()),
+                        ('outputs', OrderedDict([('savedata', settings['savedata']),
+                                                 ('savefig', settings['savefig'])]))])
+
+def matches(stored, current):
+    """
+    Whether stored results are still valid: same inputs, parameters and code, and at least the requested outputs.
+
+    :param stored: fingerprint of the stored results.
+    :param current: fingerprint of the results that are requested.
+
+    """
+    if stored is None:
+        return False
+    for key in ('version', 'parameters', 'code'):
+        if stored.get(key) != current[key]:
+            return False
+    if [entry['digest'] for entry in stored.get('inputs', [])] != [entry['digest'] for entry in current['inputs']]:
+        return False
+    return all(stored['outputs'].get(output) or not requested for output, requested in current['outputs'].items())
+
+def load_fingerprint(folder):
+    """
+    Load the fingerprint stored in a results folder.
+
+    :param folder: results folder of a trial.
+    :return: fingerprint dictionary, or None if there is no (readable) fingerprint.
+
+    """
+    try:
+        with open(os.path.join(folder, FINGERPRINT_FILE)) as f:
+            return json.load(f, object_pairs_hook=OrderedDict)
+    except (OSError, ValueError):
+        return None
+
+def invalidate(folder):
+    """
+    Remove the fingerprint of a results folder, before its results are overwritten.
+
+    :param folder: results folder of a trial.
+
+    """
+    try:
+        os.remove(os.path.join(folder, FINGERPRINT_FILE))
+    except FileNotFoundError:
+        pass
+
+def load_results(folder):
+    """
+    Load the summary statistics and detection plot data stored with the results of a trial.
+
+    :param folder: results folder of a trial.
+    :return: tuple of the EventStatistics of the trial and its plot-ready detection data (None if not stored).
+
+    """
+    with open(os.path.join(folder, STATISTICS_FILE)) as f:
+        statistics = event_statistics.EventStatistics.from_dict(json.load(f))
+
+    detectiondata = None
+    if os.path.isfile(os.path.join(folder, DETECTION_PLOT_FILE)):
+        with np.load(os.path.join(folder, DETECTION_PLOT_FILE), allow_pickle=False) as npz:
+            detectiondata = OrderedDict([('hz', float(npz['hz']))])
+            for name in ('v', 'x', 'y'):
+                detectiondata[name] = (npz[name + '_time'], npz[name])
+            detectiondata['spans'] = OrderedDict((label, (npz['spans_start_' + label], npz['spans_end_' + label]))
+                                                 for label in npz['span_labels'].tolist())
+    return statistics, detectiondata
+
+def save_results(folder, fingerprint, statistics, detectiondata=None):
+    """
+    Store the summary statistics and detection plot data of a trial, and then its fingerprint. Every file is
+    written to a temporary file first, so a crash never leaves a partial file behind.
+
+    :param folder: results folder of a trial.
+    :param fingerprint: fingerprint of the results, see fingerprint().
+    :param statistics: EventStatistics of the trial.
+    :param detectiondata: plot-ready detection data of the trial, see plotters.detection_data.
+
+    """
+    os.makedirs(folder, exist_ok=True)
+    _write(os.path.join(folder, STATISTICS_FILE), lambda f: f.write(json.dumps(statistics.to_dict()).encode()))
+
+    if detectiondata is not None:
+        arrays = OrderedDict([('hz', np.array(detectiondata['hz']))])
+        for name in ('v', 'x', 'y'):
+            arrays[name + '_time'], arrays[name] = detectiondata[name]
+        arrays['span_labels'] = np.array(list(detectiondata['spans']), dtype=str)
+        for label, (starts, ends) in detectiondata['spans'].items():
+            arrays['spans_start_' + label] = starts
+            arrays['spans_end_' + label] = ends
+        _write(os.path.join(folder, DETECTION_PLOT_FILE), lambda f: np.savez(f, **arrays))
+
+    _write(os.path.join(folder, FINGERPRINT_FILE), lambda f: f.write(json.dumps(fingerprint, indent=1).encode()))
+
+def _write(file, write):
+    temporary = file + '.tmp'
+    with open(temporary, 'wb') as f:
+        write(f)
+    os.replace(temporary, file)
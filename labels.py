@@ -0,0 +1,37 @@
+import numpy as np
+from arff_helper import ArffHelper
+
+"""
+Eye movement labels.
+
+The EYE_MOVEMENT_TYPE column stores every label as a small integer: its position in EVENTS. Comparing or assigning
+labels in the detectors and calculators is done with the codes below (e.g. labels.SACCADE), the names are only
+needed when the labels are exported (decode).
+"""
+
+# names of the labels, the code of a label is its position in this tuple
+EVENTS = ('UNKNOWN', 'FIX', 'SACCADE', 'SP', 'NOISE', 'BLINK', 'NOISE_CLUSTER', 'PSO')
+UNKNOWN, FIX, SACCADE, SP, NOISE, BLINK, NOISE_CLUSTER, PSO = range(len(EVENTS))
+# numpy type of the codes
+DTYPE = ArffHelper._convert_dtype_to_numpy(EVENTS)
+
+
+def encode(names):
+    """
+    Convert label names into their codes.
+
+    :param names: array or list of label names.
+    :return: numpy array of label codes.
+
+    """
+    return ArffHelper.encode_categorical(names, EVENTS)
+
+def decode(codes):
+    """
+    Convert label codes into their names, e.g. for saving the labels.
+
+    :param codes: array of label codes.
+    :return: numpy array of label names.
+
+    """
+    return np.array(EVENTS)[np.asarray(codes)]
@@ -1,81 +1,103 @@
 import os
 import matplotlib.pyplot as plt
-import numpy as np
-import readers
-import calculators
+import manifest
+import event_statistics
 import plotters
-import functions
-import run_detection
-from pathlib import Path
+import render_queue
+import pipeline
 
 savedata        = False     # whether or not the gaze events and their measures are saved in .csv files
 showfig         = True      # whether or not the plot figures are shown after detection
 savefig         = False     # whether or not the plot figures are saved after detection
 debugdetection  = False     # show runtime info about the detection in the console
 printresults    = True      # show results of the detection in the console
+multiobserver   = False     # detect smooth pursuit on the recordings of all participants of a trial together
 
 # Import csv files --------------------------------------------------------------------------------------------------
-datapath        = os.getcwd() + "/testdata/"    # put the full path to your data here
-participants    = 2                             # number of participants
-trials          = 2                             # trials per participant
+datapath        = os.getcwd() + "/testdata/"    # put the full path to your data here (participant/trial folders)
 filename        = 'varjo_gaze_output'           # looks for files with this string in the name
-
-for participant in range(1, participants + 1):
-    print(), print(), print('Analyisis results for participant {}'.format(participant))
-    #start plot
-    fig, axs = plt.subplots(trials, figsize=[25.60, 7.20*trials])
-    fig.suptitle('Detection per trial for participant {}'.format(participant))
-
-    for trial in range(1, trials + 1):
-        trialpath = datapath + '{}/{}/'.format(participant,trial)
-
-        print(), print('Trial ' + str(trial))
-        csvdata  = readers.file_reader(trialpath, participant, trial, filename)
-        gazedata = readers.gaze_arff(csvdata)
-
-# classify gaze events ----------------------------------------------------------------------------------------------
-        classifiedgazedata = run_detection.DetectGazeEvents(gazedata, debugdetection)
-
-        t = classifiedgazedata['data']['time'] / 1000           # [s]
-        x = classifiedgazedata['data']['x']                     # [deg]
-        y = classifiedgazedata['data']['y']                     # [deg]
-        v = classifiedgazedata['data']['v']                     # [deg/s]
-        e = classifiedgazedata['data']['EYE_MOVEMENT_TYPE']     # ('UNKNOWN', 'FIX', 'SACCADE', 'SP', 'NOISE', 'BLINK', 'NOISE_CLUSTER', 'PSO')
-
-        hz = 1000 / np.mean(np.diff(classifiedgazedata['data']['time']))
-        print("Gaze data recorded at: {} Hz".format(hz))
-
-# Analyzing gaze event measures --------------------------------------------------------------------------------------
-        Fixations = calculators.fixation(x, y, t, e, printresults)
-        Saccades  = calculators.saccade(x, y, v, t, e, printresults)
-        Pursuits  = calculators.pursuit(x, y, v, t, e, printresults)
-        Blinks    = calculators.blink(t, e, printresults)
-
-# Saving gaze event data ---------------------------------------------------------------------------------------------
-        if savedata:
-            outputpath = trialpath + 'detection'
-            Path(outputpath).mkdir(parents=True, exist_ok=True)
-
-            # save detections per even type with their measures
-            functions.save_events(Fixations, 'fixations.csv', outputpath)
-            functions.save_events(Saccades, 'saccades.csv', outputpath)
-            functions.save_events(Pursuits, 'pursuits.csv', outputpath)
-            functions.save_events(Blinks, 'blinks.csv', outputpath)
-
-            # add gaze_event classification column to raw data and save copy
-            csvdata["gaze_event"] = classifiedgazedata['data']['EYE_MOVEMENT_TYPE']
-            csvdata.to_csv(outputpath + "/classified_data.csv")
+readworkers     = 4                             # number of threads that parse large csv files in parallel chunks
+usecache        = True                          # whether or not parsed recordings are cached, to skip parsing on re-runs
+cachedir        = None                          # folder for the cache, None to keep it in a 'cache' folder per trial
+renderworkers   = 2                             # processes that render the saved figures when they are not shown
+
+def process_recordings(recordings, multiobserver=False):
+    return pipeline.process_recordings(recordings, savedata, multiobserver, usecache, cachedir, readworkers,
+                                       debugdetection, printresults)
+
+if __name__ == '__main__':
+    # index all participant/trial folders once, the index is stored in the data folder as manifest.json
+    recordings = manifest.update(datapath, filename)
+    for missing in recordings['missing']:
+        print('No gaze data found for participant {}, trial {}'.format(missing['participant'], missing['trial']))
+
+    # in multi observer mode all recordings of a trial are processed together before the results per participant
+    processed = dict()
+    if multiobserver:
+        for trial, trialrecordings in manifest.trials(recordings):
+            for recording, result in zip(trialrecordings, process_recordings(trialrecordings, multiobserver=True)):
+                processed[recording['file']] = result
+
+    # saved figures that are not shown are rendered by background processes, while the detection continues
+    renderqueue = render_queue.RenderQueue(renderworkers) if savefig and not showfig else None
+
+    # summary statistics of the event measures, of every participant and of the whole dataset
+    datasetstatistics = event_statistics.EventStatistics()
+    for participant, participantrecordings in manifest.participants(recordings):
+        print(), print(), print('Analyisis results for participant {}'.format(participant))
+        participantstatistics = event_statistics.EventStatistics()
+        trials = len(participantrecordings)
+        #start plot
+        if renderqueue is None:
+            fig, axs = plt.subplots(trials, figsize=[25.60, 7.20*trials])
+            fig.suptitle('Detection per trial for participant {}'.format(participant))
+
+        for trialindex, recording in enumerate(participantrecordings, 1):
+            trial = recording['trial']
+            trialpath = recording['path'] + '/'
+
+            print(), print('Trial ' + str(trial))
+
+# classify gaze events, analyze their measures and save them --------------------------------------------------------
+            if recording['file'] in processed:
+                result = processed.pop(recording['file'])
+            else:
+                result = process_recordings([recording])[0]
+
+            t, x, y, v, hz = result['t'], result['x'], result['y'], result['v'], result['hz']
+            Fixations, Saccades, Pursuits, Blinks = result['events']
+            participantstatistics.add(result['events'])
 
 # Plotting and saving------------------------------------------------------------------------------------------------
-        plotters.detection(x, y, t, v, Fixations, Saccades, Pursuits, Blinks, trials, trial, axs, hz)
-        plotters.calculation(Fixations, Saccades, Pursuits, Blinks, trial, participant)
-        outputpath = trialpath + "calculation-p{}-t{}.png".format(participant, trial, participant, trial)
+            outputpath = trialpath + "calculation-p{}-t{}.png".format(participant, trial, participant, trial)
+            if renderqueue is not None:
+                renderqueue.add_trial(participant, trialindex,
+                                      plotters.detection_data(x, y, t, v, Fixations, Saccades, Pursuits, Blinks, hz),
+                                      plotters.calculation_data(Fixations, Saccades, Pursuits, Blinks), outputpath)
+                continue
+            plotters.detection(x, y, t, v, Fixations, Saccades, Pursuits, Blinks, trials, trialindex, axs, hz)
+            plotters.calculation(Fixations, Saccades, Pursuits, Blinks, trialindex, participant)
+            if savefig: plt.savefig(outputpath, bbox_inches='tight')
+
+        datasetstatistics.merge(participantstatistics)
+        if savedata:
+            participantstatistics.summary().to_csv(datapath + '{}/summary-p{}.csv'.format(participant, participant),
+                                                   index=False)
+
+        outputpath = datapath + '{}/detection-p{}.png'.format(participant, participant)
+        if renderqueue is not None:
+            renderqueue.finish_participant(participant, outputpath)
+            continue
+        plt.figure(1)
         if savefig: plt.savefig(outputpath, bbox_inches='tight')
+        if showfig: plt.show()
+        if savefig: plt.close('all')
 
-    plt.figure(1)
-    outputpath = datapath + '{}/detection-p{}.png'.format(participant, participant)
-    if savefig: plt.savefig(outputpath, bbox_inches='tight')
-    if showfig: plt.show()
-    if savefig: plt.close('all')
-
+    if renderqueue is not None:
+        renderqueue.close()
 
+# Dataset summary ----------------------------------------------------------------------------------------------------
+    if printresults:
+        print(), print(), print('Summary of all {} trials'.format(datasetstatistics.trials))
+        print(datasetstatistics.summary().to_string(index=False))
+    if savedata: datasetstatistics.summary().to_csv(datapath + 'summary.csv', index=False)
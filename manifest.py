@@ -0,0 +1,178 @@
+import os
+import json
+from collections import OrderedDict
+
+"""
+Index of the recordings in a data folder with the structure data_folder/participant/trial/.
+
+The folder tree is walked once, and for every trial the gaze data file is recorded together with its size,
+an estimate of its number of samples, the way it was recorded (Varjo Base or Unity) and whether a video capture
+(varjo_capture file) is present. Trial folders without gaze data are listed separately.
+The index is stored as json in the data folder, so that batch runs can plan their work from it. When the index is
+updated, recordings that did not change (same size and modification time) are not opened again.
+"""
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+CAPTURE_FILENAME = 'varjo_capture'
+# a column that is only logged by the Unity script, see Unity/EyeTracking.cs
+UNITY_COLUMN = 'HMD_position_x'
+# number of bytes at the start of a recording that are read to get the header and the average row length
+SAMPLE_BYTES = 2 ** 16
+
+
+def scan(datapath, filename='varjo_gaze_output', previous=None):
+    """
+    Walk the participant and trial folders in @datapath and index the recordings in them.
+
+    :param datapath: data folder with participant/trial/ sub folders.
+    :param filename: (part of) the name of the gaze data files.
+    :param previous: earlier manifest of the same folder, its entries are reused for recordings that did not change.
+    :return: manifest dictionary with a list of 'recordings' and a list of 'missing' trials (without gaze data).
+
+    """
+    known = dict()
+    if previous is not None and previous.get('version') == MANIFEST_VERSION:
+        known = {recording['file']: recording for recording in previous['recordings']}
+
+    recordings = []
+    missing = []
+    for participant in _sorted_folders(datapath):
+        for trial in _sorted_folders(participant.path):
+            files = sorted((item for item in os.scandir(trial.path) if item.is_file()), key=lambda item: item.name)
+            gaze_files = [item for item in files if filename in item.name and item.name.endswith('.csv')]
+            capture_files = [item.name for item in files if CAPTURE_FILENAME in item.name]
+
+            if not gaze_files:
+                missing.append(OrderedDict([('participant', participant.name),
+                                            ('trial', trial.name),
+                                            ('path', os.path.abspath(trial.path))]))
+                continue
+
+            # like readers.file_reader, the first gaze data file is used
+            file = os.path.abspath(gaze_files[0].path)
+            stat = gaze_files[0].stat()
+            recording = known.get(file)
+            if recording is None or recording['size'] != stat.st_size or recording['mtime_ns'] != stat.st_mtime_ns:
+                recording = OrderedDict([('participant', participant.name),
+                                         ('trial', trial.name),
+                                         ('path', os.path.abspath(trial.path)),
+                                         ('file', file),
+                                         ('size', stat.st_size),
+                                         ('mtime_ns', stat.st_mtime_ns)])
+                recording.update(inspect(file, stat.st_size))
+            recording['capture_files'] = capture_files
+            recording['capture'] = len(capture_files) > 0
+            recordings.append(recording)
+
+    return OrderedDict([('version', MANIFEST_VERSION),
+                        ('datapath', os.path.abspath(datapath)),
+                        ('filename', filename),
+                        ('recordings', recordings),
+                        ('missing', missing)])
+
+def inspect(file, size):
+    """
+    Read the start of a recording to determine how it was recorded and estimate its number of samples.
+
+    :param file: path to the gaze data .csv file.
+    :param size: size of the file in bytes.
+    :return: dictionary with the 'source' ('varjo_base' or 'unity'), the 'columns' and the 'rows' estimate.
+
+    """
+    with open(file, 'rb') as f:
+        sample = f.read(SAMPLE_BYTES)
+
+    lines = sample.split(b'\n')
+    columns = lines[0].decode().strip().split(',')
+    # only complete lines are used for the average row length
+    rows = lines[1:-1] if len(sample) == SAMPLE_BYTES or not sample.endswith(b'\n') else lines[1:]
+    rows = [row for row in rows if row.strip()]
+    if rows:
+        row_length = (sum(len(row) for row in rows) + len(rows)) / len(rows)
+        row_estimate = int(round((size - len(lines[0]) - 1) / row_length))
+    else:
+        row_estimate = 0
+
+    return OrderedDict([('source', 'unity' if UNITY_COLUMN in columns else 'varjo_base'),
+                        ('columns', columns),
+                        ('rows', row_estimate)])
+
+def participants(manifest):
+    """
+    Group the recordings of a manifest per participant.
+
+    :param manifest: manifest dictionary, as made by scan().
+    :return: list of (participant, list of recordings) tuples, in the order of the manifest.
+
+    """
+    grouped = OrderedDict()
+    for recording in manifest['recordings']:
+        grouped.setdefault(recording['participant'], []).append(recording)
+    return list(grouped.items())
+
+def trials(manifest):
+    """
+    Group the recordings of a manifest per trial, e.g. to process the recordings of all participants that watched
+    the same stimulus together.
+
+    :param manifest: manifest dictionary, as made by scan().
+    :return: list of (trial, list of recordings) tuples, trials in order of their first recording.
+
+    """
+    grouped = OrderedDict()
+    for recording in manifest['recordings']:
+        grouped.setdefault(recording['trial'], []).append(recording)
+    return list(grouped.items())
+
+def load(datapath):
+    """
+    Load the stored manifest of a data folder.
+
+    :param datapath: data folder.
+    :return: manifest dictionary, or None if there is no (readable) manifest.
+
+    """
+    try:
+        with open(os.path.join(datapath, MANIFEST_FILE)) as f:
+            return json.load(f, object_pairs_hook=OrderedDict)
+    except (OSError, ValueError):
+        return None
+
+def save(manifest):
+    """
+    Store a manifest as json in its data folder. A temporary file is written first, so a crash never leaves a
+    partial manifest behind.
+
+    :param manifest: manifest dictionary, as made by scan().
+
+    """
+    file = os.path.join(manifest['datapath'], MANIFEST_FILE)
+    with open(file + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(file + '.tmp', file)
+
+def update(datapath, filename='varjo_gaze_output'):
+    """
+    Scan a data folder, reusing its stored manifest for unchanged recordings, and store the new manifest.
+
+    :param datapath: data folder with participant/trial/ sub folders.
+    :param filename: (part of) the name of the gaze data files.
+    :return: the new manifest dictionary.
+
+    """
+    previous = load(datapath)
+    if previous is not None and previous.get('filename') != filename:
+        previous = None
+    manifest = scan(datapath, filename, previous)
+    save(manifest)
+    return manifest
+
+def _sorted_folders(path):
+    """
+    Sub folders of @path in natural order (numbered folders by number, then the others by name).
+    Hidden folders are skipped.
+
+    """
+    folders = [item for item in os.scandir(path) if item.is_dir() and not item.name.startswith('.')]
+    return sorted(folders, key=lambda item: (0, int(item.name), '') if item.name.isdigit() else (1, 0, item.name))
@@ -0,0 +1,82 @@
+import numpy as np
+from collections import OrderedDict
+from pathlib import Path
+
+import cache
+import labels
+import calculators
+import functions
+import run_detection
+import incremental
+
+"""
+Processing of the recordings of a trial, shared by main.py and batch.py: every recording is read (from the cache if
+possible), classified, the measures of its events are calculated and, if asked, its events and its classified data
+are saved in the detection folder of the trial.
+"""
+
+# event tables of a trial and the .csv files they are saved in
+EVENT_FILES = ['fixations.csv', 'saccades.csv', 'pursuits.csv', 'blinks.csv']
+
+
+def process_recordings(recordings, savedata=False, multiobserver=False, usecache=True, cachedir=None, readworkers=1,
+                       debugdetection=False, printresults=False):
+    """
+    Read, classify and measure recordings, and save their results.
+
+    :param recordings: list of recording entries of the manifest; a single recording, or in multi observer mode the
+                       recordings of all participants of a trial.
+    :param savedata: whether the events and the classified data are saved as .csv files in the detection folder.
+    :param multiobserver: whether the smooth pursuit of the recordings is detected together.
+    :param usecache: whether parsed recordings are cached, see cache.read_gaze_data.
+    :param cachedir: folder of the cache, None for a 'cache' folder per trial.
+    :param readworkers: number of threads that parse a large .csv file.
+    :param debugdetection: whether to show runtime info about the detection.
+    :param printresults: whether to show the results of the detection in the console.
+    :return: list with a dictionary per recording, with its time [s], x and y [deg], v [deg/s] and e (label codes)
+             signals, its sampling rate hz and its events, a list of the fixation, saccade, pursuit and blink
+             EventTables.
+
+    """
+    data = [cache.read_gaze_data(recording['file'], savedata, usecache, cachedir, readworkers)
+            for recording in recordings]
+    # the recordings are not used anymore after the detection, so they are labelled in place instead of copied
+    if multiobserver:
+        classified = run_detection.DetectGazeEventsMultiObserver([gazedata for _, gazedata in data], debugdetection,
+                                                                 inplace=True)
+    else:
+        classified = [run_detection.DetectGazeEvents(gazedata, debugdetection, inplace=True) for _, gazedata in data]
+
+    results = []
+    for recording, (csvdata, _), classifiedgazedata in zip(recordings, data, classified):
+        t = classifiedgazedata['data']['time'] / 1000           # [s]
+        x = classifiedgazedata['data']['x']                     # [deg]
+        y = classifiedgazedata['data']['y']                     # [deg]
+        v = classifiedgazedata['data']['v']                     # [deg/s]
+        e = classifiedgazedata['data']['EYE_MOVEMENT_TYPE']     # label codes, names in labels.EVENTS
+        hz = 1000 / np.mean(np.diff(classifiedgazedata['data']['time']))
+
+        if printresults:
+            if multiobserver:
+                print(), print('Participant {}, trial {}'.format(recording['participant'], recording['trial']))
+            print("Gaze data recorded at: {} Hz".format(hz))
+
+        runs = calculators.event_runs(e)                      # start and end of the events of every label
+        events = [calculators.fixation(x, y, t, e, printresults, runs),
+                  calculators.saccade(x, y, v, t, e, printresults, runs),
+                  calculators.pursuit(x, y, v, t, e, printresults, runs),
+                  calculators.blink(t, e, printresults, runs)]
+
+        if savedata:
+            outputpath = incremental.output_folder(recording)
+            Path(outputpath).mkdir(parents=True, exist_ok=True)
+            # save detections per even type with their measures
+            for table, fname in zip(events, EVENT_FILES):
+                functions.save_events(table, fname, outputpath)
+            # add gaze_event classification column to raw data and save copy
+            csvdata["gaze_event"] = labels.decode(e)
+            csvdata.to_csv(outputpath + "/classified_data.csv")
+
+        results.append(OrderedDict([('t', t), ('x', x), ('y', y), ('v', v), ('e', e), ('hz', hz),
+                                    ('events', events)]))
+    return results
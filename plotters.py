@@ -1,118 +1,167 @@
 import matplotlib.pyplot as plt
 import numpy as np
+from collections import OrderedDict
+from matplotlib.collections import PolyCollection
 from scipy.stats import rayleigh
 from scipy.stats import norm
+from signal_pyramid import SignalPyramid, merge_spans
 
 """
 Functions for helping with plotting of various figures and data
 """
 
-def detection(x, y, t, v, fixations, saccades, pursuits, blinks, trials, trial, axs, hz):
+# width of the detection figure in pixels (at 100 dpi), the signals are decimated to at least a point per pixel
+DETECTION_PIXELS = 2560
+# label and color of the spans of every event type in the detection plot
+EVENT_SPANS = (('Fixations', 'g'), ('Saccades', 'r'), ('Pursuits', 'y'), ('Blinks', 'b'))
+# histograms of the calculation figure: event type, measure, subplot, title and x label
+CALCULATION_PLOTS = (('Fixations', 'duration', 1, "Fixation duration", 'Time [s]'),
+                     ('Saccades', 'duration', 5, "Saccade duration", 'Time [s]'),
+                     ('Saccades', 'amplitude', 6, "Saccade amplitude", 'Amplitude [deg]'),
+                     ('Saccades', 'mean_vel', 7, "Saccade mean velocity", 'Velocity [deg/s]'),
+                     ('Saccades', 'max_vel', 8, "Saccade max velocity", 'Velocity [deg/s]'),
+                     ('Pursuits', 'duration', 9, "Pursuit duration", 'Time [s]'),
+                     ('Pursuits', 'amplitude', 10, "Pursuit amplitude", 'Amplitude [deg]'),
+                     ('Pursuits', 'mean_vel', 11, "Pursuit mean velocity", 'Velocity [deg/s]'),
+                     ('Pursuits', 'max_vel', 12, "Pursuit max velocity", 'Velocity [deg/s]'),
+                     ('Blinks', 'duration', 13, "Blink duration", 'Time [s]'))
+
+def detection(x, y, t, v, fixations, saccades, pursuits, blinks, trials, trial, axs, hz, pyramid=None):
+    """
+    Plot the signals of a recording with the spans of its gaze events. Long recordings are drawn from the level of
+    their SignalPyramid that matches the width of the plot in pixels, and spans of the same event type that are less
+    than a pixel apart are drawn as one span.
+
+    :param pyramid: SignalPyramid of the recording, made from @t, @x, @y and @v if not given.
+
+    """
     if trials > 1:
         axs1 = axs[trial - 1]
     else:
         axs1 = axs
-
-    hz = round(hz)
+    pixels = int(np.ceil(axs1.get_window_extent().width))
+    draw_detection(axs1, detection_data(x, y, t, v, fixations, saccades, pursuits, blinks, hz, pixels, pyramid), trial)
+
+def detection_data(x, y, t, v, fixations, saccades, pursuits, blinks, hz, pixels=DETECTION_PIXELS, pyramid=None):
+    """
+    Plot-ready data of the detection plot of a recording: its signals decimated to @pixels and the merged spans of
+    its events. The data does not refer to the recording, so it stays small and can be sent to another process.
+
+    :param pixels: width of the plot in pixels.
+    :param pyramid: SignalPyramid of the recording, made from @t, @x, @y and @v if not given.
+    :return: dictionary with the recording rate, the points of the v, x and y lines and the spans of every event type.
+
+    """
+    if pyramid is None:
+        pyramid = SignalPyramid(t, x, y, v)
+    resolution = (t[-1] - t[0]) / pixels if len(t) > 1 else 0
+
+    data = OrderedDict([('hz', hz)])
+    for name in ('v', 'x', 'y'):
+        data[name] = tuple(np.array(points) for points in pyramid.line(name, pixels))
+    data['spans'] = OrderedDict()
+    for events, (label, _) in zip((fixations, saccades, pursuits, blinks), EVENT_SPANS):
+        if len(events) > 0:
+            data['spans'][label] = merge_spans(events.t_start, events.t_end, resolution)
+    return data
+
+def draw_detection(axs1, data, trial):
+    """
+    Draw the detection plot of a recording.
+
+    :param axs1: matplotlib axes to draw on.
+    :param data: plot-ready data of the recording, see detection_data.
+    :param trial: number of the trial in the title.
+
+    """
+    hz = round(data['hz'])
     axs1.set_title('Trial {}, recorded at {}hz'.format(trial,hz))
     axs1.set_xlabel('Time [s]')
 
-    axs1.plot(t, v, 'silver', label="Velocity")
+    axs1.plot(*data['v'], 'silver', label="Velocity")
     axs1.set_ylabel('Velocity [deg/s]')
     axs1.set_ylim([-1000, 1000])
 
     axs2 = axs1.twinx()
-    axs2.plot(t, x, 'tab:orange', label="Horizontal")
-    axs2.plot(t, y, 'tab:green', label="Vertical")
+    axs2.plot(*data['x'], 'tab:orange', label="Horizontal")
+    axs2.plot(*data['y'], 'tab:green', label="Vertical")
     axs2.set_ylabel('Angel [deg]')
     axs2.set_ylim([-22.5, 22.5])
 
-    for i in range(len(fixations)):
-        axs1.axvspan(fixations[i, 0], fixations[i, 1], color='g', alpha=.1, label =  "_"*i + "Fixations")
-    for i in range(len(saccades)):
-        axs1.axvspan(saccades[i, 0], saccades[i, 1], color='r', alpha=.1, label =  "_"*i + "Saccades")
-    for i in range(len(pursuits)):
-        axs1.axvspan(pursuits[i, 0], pursuits[i, 1], color='y', alpha=.1, label =  "_"*i + "Pursuits")
-    for i in range(len(blinks)):
-        axs1.axvspan(blinks[i, 0], blinks[i, 1], color='b', alpha=.1, label =  "_"*i + "Blinks")
+    for label, color in EVENT_SPANS:
+        if label in data['spans']:
+            spans(axs1, *data['spans'][label], color=color, label=label)
 
     axs1.legend(loc='upper left')
     axs2.legend(loc='upper right')
 
+def spans(axs, starts, ends, color, label):
+    # all spans of an event type as one artist, covering the full height of the axes like axvspan
+    vertices = [[(start, 0), (start, 1), (end, 1), (end, 0)] for start, end in zip(starts, ends)]
+    collection = PolyCollection(vertices, facecolors=color, edgecolors=color, alpha=.1, label=label,
+                                transform=axs.get_xaxis_transform())
+    axs.add_collection(collection, autolim=False)
+    axs.update_datalim([(min(starts), 0), (max(ends), 0)], updatey=False)
+    axs.autoscale_view(scaley=False)
+
 def calculation(fixations, saccades, pursuits, blinks, trial, participant):
-    plt.figure(trial + 1, figsize=[25.60, 14.40])
-    plt.suptitle('Gaze event analysis for participant {}, trail {}'.format(participant, trial))
-    if fixations.any():
-        plt.subplot(4, 4, 1)
-        histogramreighley(fixations[:, 2])
-        plt.title("Fixation duration")
-        plt.xlabel('Time [s]')
-
-    if saccades.any():
-        plt.subplot(4, 4, 5)
-        histogramreighley(saccades[:, 2])
-        plt.title("Saccade duration")
-        plt.xlabel('Time [s]')
-        plt.subplot(4, 4, 6)
-        histogramreighley(saccades[:, 7])
-        plt.title("Saccade amplitude")
-        plt.xlabel('Amplitude [deg]')
-        plt.subplot(4, 4, 7)
-        histogramreighley(saccades[:, 8])
-        plt.title("Saccade mean velocity")
-        plt.xlabel('Velocity [deg/s]')
-        plt.subplot(4, 4, 8)
-        histogramreighley(saccades[:, 9])
-        plt.title("Saccade max velocity")
-        plt.xlabel('Velocity [deg/s]')
-
-    if pursuits.any():
-        plt.subplot(4, 4, 9)
-        histogramreighley(pursuits[:, 2])
-        plt.title("Pursuit duration")
-        plt.xlabel('Time [s]')
-        plt.subplot(4, 4, 10)
-        histogramreighley(pursuits[:, 7])
-        plt.title("Pursuit amplitude")
-        plt.xlabel('Amplitude [deg]')
-        plt.subplot(4, 4, 11)
-        plt.xlabel('Amplitude [deg]')
-        histogramreighley(pursuits[:, 8])
-        plt.title("Pursuit mean velocity")
-        plt.xlabel('Velocity [deg/s]')
-        plt.subplot(4, 4, 12)
-        histogramreighley(pursuits[:, 9])
-        plt.title("Pursuit max velocity")
-        plt.xlabel('Velocity [deg/s]')
-
-    if blinks.any():
-        plt.subplot(4, 4, 13)
-        histogramreighley(blinks[:, 2])
-        plt.title("Blink duration")
-        plt.xlabel('Time [s]')
-
-    plt.tight_layout()
-
-
-def histogramreighley(data):
+    draw_calculation(plt.figure(trial + 1, figsize=[25.60, 14.40]),
+                     calculation_data(fixations, saccades, pursuits, blinks), trial, participant)
+
+def calculation_data(fixations, saccades, pursuits, blinks):
+    """
+    Plot-ready data of the calculation figure of a trial: the measures of its events that are shown.
+
+    :return: dictionary with, per event type that has events, a dictionary of the measures.
+
+    """
+    data = OrderedDict()
+    for events, (label, _) in zip((fixations, saccades, pursuits, blinks), EVENT_SPANS):
+        if len(events) > 0:
+            data[label] = OrderedDict((measure, np.array(events[measure]))
+                                      for event, measure, _, _, _ in CALCULATION_PLOTS if event == label)
+    return data
+
+def draw_calculation(fig, data, trial, participant):
+    """
+    Draw the histograms of the event measures of a trial.
+
+    :param fig: matplotlib figure to draw on.
+    :param data: plot-ready data of the trial, see calculation_data.
+
+    """
+    fig.suptitle('Gaze event analysis for participant {}, trail {}'.format(participant, trial))
+    for event, measure, subplot, title, xlabel in CALCULATION_PLOTS:
+        if event in data:
+            ax = fig.add_subplot(4, 4, subplot)
+            histogramreighley(data[event][measure], ax)
+            ax.set_title(title)
+            ax.set_xlabel(xlabel)
+
+    fig.tight_layout()
+
+
+def histogramreighley(data, ax=None):
+    if ax is None:
+        ax = plt.gca()
     N = len(data)
     scale = data.mean() / np.sqrt(np.pi / 2)
     V_norm_hist = scale * np.sqrt(-2 * np.log(np.random.uniform(0, 1, N)))
 
     num_bins = 30
-    _binvalues, bins, _patches = plt.hist(V_norm_hist, bins=num_bins, density=False, rwidth=1, ec='white',
-                                          label='Histogram data')
+    _binvalues, bins, _patches = ax.hist(V_norm_hist, bins=num_bins, density=False, rwidth=1, ec='white',
+                                         label='Histogram data')
     x = np.linspace(bins[0], bins[-1], 100)
     binwidth = (bins[-1] - bins[0]) / num_bins
 
     scale = V_norm_hist.mean() / np.sqrt(np.pi / 2)
 
-    plt.plot(x, rayleigh(loc=0, scale=scale).pdf(x) * len(V_norm_hist) * binwidth, lw=5, alpha=0.6,
-             label=f'Rayleigh pdf (s={scale:.3f})')
-    plt.axvline(data.mean(), color='red', lw=3, alpha=0.6, label='Mean = ' + str(data.mean()))
-    plt.ylabel('samples [n]')
-    plt.grid(True)
-    plt.legend()
+    ax.plot(x, rayleigh(loc=0, scale=scale).pdf(x) * len(V_norm_hist) * binwidth, lw=5, alpha=0.6,
+            label=f'Rayleigh pdf (s={scale:.3f})')
+    ax.axvline(data.mean(), color='red', lw=3, alpha=0.6, label='Mean = ' + str(data.mean()))
+    ax.set_ylabel('samples [n]')
+    ax.grid(True)
+    ax.legend()
 
 
 def histogramfit(data):
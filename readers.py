@@ -1,18 +1,65 @@
+import io
 import os
 import pandas
 import math
 import functions
 import numpy as np
+from gaze_recording import GazeRecording
+from concurrent.futures import ThreadPoolExecutor
 
+# pyarrow ships a multithreaded csv parser that pandas can use as engine, it is used when available
+try:
+    import pyarrow
+    DEFAULT_ENGINE = 'pyarrow'
+except ImportError:
+    DEFAULT_ENGINE = 'c'
 
-def file_reader(path, participant, trial, filename):
+# Columns used by the detection pipeline and the (compact) types they are parsed as. Columns that are missing in a
+# recording (e.g. the video timestamp in Unity recordings) are skipped. Integer columns that turn out to have missing
+# values are parsed as float64 instead.
+GAZE_COLUMNS = {'raw_timestamp': np.int64,
+                'relative_to_video_first_frame_timestamp': np.int64,
+                'status': np.int8,
+                'gaze_forward_x': np.float64,
+                'gaze_forward_y': np.float64}
+
+# files smaller than this are never split into chunks for parallel parsing
+MIN_CHUNK_BYTES = 8 * 2 ** 20
+
+
+def file_reader(path, participant, trial, filename, columns=None, workers=1, engine=None):
+    """
+    Read the gaze data .csv in the folder @path and patch the gaps left by blinks.
+
+    :param path: folder of the trial, the first .csv file with @filename in its name is read.
+    :param filename: (part of) the name of the gaze data file.
+    :param columns: None to read all columns, or a dictionary of column name -> dtype (e.g. GAZE_COLUMNS) to only
+                    parse those columns with those types.
+    :param workers: number of threads that parse chunks of large files in parallel.
+    :param engine: pandas parser engine, defaults to pyarrow when it is installed.
+    :return: pandas DataFrame with the gaze data.
+
+    """
     # read data file
     file = [i for i in os.listdir(path) if os.path.isfile(os.path.join(path, i)) and \
-            filename in i]
-    csvdata = pandas.read_csv(path + file[0], delimiter=',')
+            filename in i and i.endswith('.csv')]
+
+    return recording_reader(os.path.join(path, file[0]), columns=columns, workers=workers, engine=engine)
 
-    # remove last row (can be partially logged) and replace nan values
-    csvdata.drop(csvdata.tail(1).index,inplace=True)
+def recording_reader(file, columns=None, workers=1, engine=None):
+    """
+    Read a gaze data .csv file and patch the gaps left by blinks.
+
+    :param file: full path to the .csv file.
+    :param columns: None to read all columns, or a dictionary of column name -> dtype.
+    :param workers: number of threads that parse chunks of large files in parallel.
+    :param engine: pandas parser engine, defaults to pyarrow when it is installed.
+    :return: pandas DataFrame with the gaze data.
+
+    """
+    csvdata = csv_reader(file, columns=columns, workers=workers, engine=engine)
+
+    # the last row (can be partially logged) is left out by the csv reader, replace nan values
     csvdata.dropna(subset=["raw_timestamp"], inplace=True)
     if 'relative_to_video_first_frame_timestamp' in csvdata.columns:
         csvdata.dropna(subset=["relative_to_video_first_frame_timestamp"], inplace=True)
@@ -23,8 +70,140 @@ def file_reader(path, participant, trial, filename):
 
     return patched_data
 
+def csv_reader(file, columns=None, workers=1, engine=None):
+    """
+    Parse a Varjo gaze data .csv file, optionally only a subset of its columns and in parallel chunks.
+    The last row of the file is left out, since it can be partially logged.
+
+    Large files are split into byte ranges that end on line boundaries, which are parsed on separate threads and
+    concatenated afterwards. The pyarrow engine is multithreaded by itself, so the file is not split for it.
+
+    :param file: full path to the .csv file.
+    :param columns: None to read all columns, or a dictionary of column name -> dtype.
+    :param workers: maximal number of chunks that are parsed in parallel.
+    :param engine: pandas parser engine, defaults to pyarrow when it is installed.
+    :return: pandas DataFrame with the parsed columns.
+
+    """
+    if engine is None:
+        engine = DEFAULT_ENGINE
+
+    with open(file, 'rb') as f:
+        names = f.readline().decode().strip().split(',')
+        body_start = f.tell()
+        body_end = _last_line_start(f)
+
+        if columns is not None:
+            usecols = [name for name in names if name in columns]
+            dtype = {name: columns[name] for name in usecols}
+        else:
+            usecols = None
+            dtype = None
+
+        # find chunk borders, each chunk ends after a newline
+        chunks = min(workers, (body_end - body_start) // MIN_CHUNK_BYTES) if engine != 'pyarrow' else 1
+        bounds = [body_start]
+        for k in range(1, chunks):
+            f.seek(body_start + (body_end - body_start) * k // chunks)
+            f.readline()
+            if bounds[-1] < f.tell() < body_end:
+                bounds.append(f.tell())
+        bounds.append(body_end)
+
+    def parse(start, end):
+        try:
+            with io.BufferedReader(_FileRange(file, start, end)) as chunk:
+                return pandas.read_csv(chunk, delimiter=',', header=None, names=names, usecols=usecols,
+                                       dtype=dtype, engine=engine)
+        except ValueError:
+            if dtype is None:
+                raise
+        # integer columns with missing values can not be parsed as such
+        float_dtype = {name: np.float64 if np.issubdtype(dtype[name], np.integer) else dtype[name] for name in dtype}
+        with io.BufferedReader(_FileRange(file, start, end)) as chunk:
+            return pandas.read_csv(chunk, delimiter=',', header=None, names=names, usecols=usecols,
+                                   dtype=float_dtype, engine=engine)
+
+    if len(bounds) == 2:
+        return parse(body_start, body_end)
+
+    with ThreadPoolExecutor(max_workers=len(bounds) - 1) as executor:
+        parts = list(executor.map(parse, bounds[:-1], bounds[1:]))
+
+    return pandas.concat(parts, ignore_index=True)
+
+def _last_line_start(f, block_size=2 ** 16):
+    """
+    Find the byte offset at which the last non-empty line of the opened binary file @f starts.
+
+    :param f: file opened in binary mode.
+    :param block_size: number of bytes read at once, going backwards from the end of the file.
+    :return: offset of the first byte of the last line.
+
+    """
+    end = f.seek(0, os.SEEK_END)
+    tail = b''
+    while end > 0:
+        start = max(0, end - block_size)
+        f.seek(start)
+        tail = f.read(end - start) + tail
+        end = start
+        newline = tail.rstrip().rfind(b'\n')
+        if newline >= 0:
+            return end + newline + 1
+    return 0
+
+class _FileRange(io.RawIOBase):
+    """
+    Read-only stream over the bytes [@start, @end) of a file, so that a chunk can be parsed without loading it first.
+    """
+    def __init__(self, file, start, end):
+        self._file = open(file, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        read = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= read
+        return read
+
+    def close(self):
+        self._file.close()
+        super(_FileRange, self).close()
+
 def gaze_arff(csvdata):
 
+    Tx, Ty, t, s = gaze_columns(csvdata)
+
+    #convert data tor arff object for processing
+    gaze_points = functions.load_CSV_as_arff_object(Tx, Ty, t, s, '')
+
+    return gaze_points
+
+def gaze_recording(csvdata):
+    """
+    Get the gaze data as column based recording, see gaze_recording.GazeRecording.
+
+    :param csvdata: gaze data as read by file_reader.
+    :return: GazeRecording with the time, gaze angles and status of the samples.
+
+    """
+    Tx, Ty, t, s = gaze_columns(csvdata)
+
+    return GazeRecording.from_columns(Tx, Ty, t, s)
+
+def gaze_columns(csvdata):
+    """
+    Get the time, gaze angles and status of the samples in the gaze data.
+
+    :param csvdata: gaze data as read by file_reader.
+    :return: tuple of the horizontal and vertical gaze angles [deg], time stamps [ms] and status of each sample.
+
+    """
     # Raw Gaze data
     s = np.array(csvdata['status'])
     x = np.array(csvdata['gaze_forward_x'])
@@ -41,8 +220,4 @@ def gaze_arff(csvdata):
     Tx = (180 / math.pi) * np.arcsin(x)
     Ty = (180 / math.pi) * np.arcsin(y)
 
-    #convert data tor arff object for processing
-    gaze_points = functions.load_CSV_as_arff_object(Tx, Ty, t, s, '')
-
-    return gaze_points
-
+    return Tx, Ty, t, s
@@ -0,0 +1,116 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+
+import plotters
+
+"""
+Rendering of the detection and calculation figures in background processes.
+
+The detection loop only computes the plot-ready data of a trial (plotters.detection_data and
+plotters.calculation_data, which are small since the signals are decimated to the width of the figure) and adds it
+to a RenderQueue. Worker processes draw the figures on the Agg backend (matplotlib Figure objects without pyplot,
+so no window is ever opened) and save them as .png files; every figure is cleared as soon as it is saved.
+The queue holds at most a few figures per worker, so a detection loop that is faster than the rendering waits
+instead of piling up plot data.
+"""
+
+# number of figures per worker that may wait to be rendered
+PENDING_PER_WORKER = 2
+
+
+def render_detection(fname, participant, trials):
+    """
+    Render and save the detection figure of a participant.
+
+    :param fname: path of the .png file.
+    :param participant: participant name, for the title.
+    :param trials: list of tuples of the number of the trial and its plot-ready data, see plotters.detection_data.
+
+    """
+    fig = Figure(figsize=[25.60, 7.20 * len(trials)])
+    fig.suptitle('Detection per trial for participant {}'.format(participant))
+    axs = fig.subplots(len(trials), squeeze=False)[:, 0]
+    for axs1, (trial, data) in zip(axs, trials):
+        plotters.draw_detection(axs1, data, trial)
+    fig.savefig(fname, bbox_inches='tight')
+    fig.clear()
+
+def render_calculation(fname, participant, trial, data):
+    """
+    Render and save the calculation figure of a trial.
+
+    :param fname: path of the .png file.
+    :param participant: participant name, for the title.
+    :param trial: number of the trial, for the title.
+    :param data: plot-ready data of the trial, see plotters.calculation_data.
+
+    """
+    fig = Figure(figsize=[25.60, 14.40])
+    plotters.draw_calculation(fig, data, trial, participant)
+    fig.savefig(fname, bbox_inches='tight')
+    fig.clear()
+
+
+class RenderQueue(object):
+    """
+    Queue of figures that are rendered and saved by a pool of worker processes, or in the calling process if
+    @workers is 0. Errors of the rendering are raised by the call that waits for the figure (a later add or close).
+    On Windows and macOS the worker processes import the calling script again, so it has to use an
+    `if __name__ == '__main__':` block.
+    """
+    def __init__(self, workers=1):
+        self.pool = ProcessPoolExecutor(workers) if workers > 0 else None
+        self.max_pending = PENDING_PER_WORKER * workers
+        self.pending = deque()
+        # participant -> list of (trial, detection data) of the trials whose detection figure is not rendered yet
+        self.participants = OrderedDict()
+
+    def add_trial(self, participant, trial, detectiondata, calculationdata, fname):
+        """
+        Add the figures of a trial: its calculation figure is rendered right away, its detection plot when
+        the participant is finished.
+
+        :param trial: number of the trial in the titles.
+        :param detectiondata: plot-ready data of the detection plot, see plotters.detection_data.
+        :param calculationdata: plot-ready data of the calculation figure, see plotters.calculation_data.
+        :param fname: path of the .png file of the calculation figure.
+
+        """
+        self.participants.setdefault(participant, []).append((trial, detectiondata))
+        self._submit(render_calculation, fname, participant, trial, calculationdata)
+
+    def finish_participant(self, participant, fname):
+        """
+        Render the detection figure of all trials that were added for a participant.
+
+        :param fname: path of the .png file of the detection figure.
+
+        """
+        self._submit(render_detection, fname, participant, self.participants.pop(participant))
+
+    def close(self):
+        """
+        Wait until all figures are saved and stop the worker processes.
+        """
+        try:
+            while self.pending:
+                self.pending.popleft().result()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _submit(self, function, *args):
+        if self.pool is None:
+            function(*args)
+            return
+        # wait for the oldest figure when the queue is full
+        while len(self.pending) >= self.max_pending:
+            self.pending.popleft().result()
+        self.pending.append(self.pool.submit(function, *args))
@@ -1,3 +1,5 @@
+import copy
+from collections import OrderedDict
 from saccade_detector import SaccadeDetector
 from blink_detector import BlinkDetector
 from fixation_detector import FixationDetector
@@ -13,7 +15,115 @@ from sp_detector import SmoothPursuitDetector
 # There you can try to relax the "prefiltering_interval_spread_threshold_degrees", "speed_threshold_degrees_per_sec" and
 # "min_sp_duration_millisec" parers.
 
-def DetectGazeEvents(gazedata, verbose):
+def DetectGazeEvents(gazedata, verbose, inplace=False, snapshots=None, workers=1):
+    """
+    Run the saccade, blink, fixation and smooth pursuit detection on a recording.
+
+    All detectors label the same data array in place, so besides the (optional) copy of the input no copies of the
+    recording are made.
+
+    :param gazedata: arff object of the recording, as made by readers.gaze_arff.
+    :param verbose: whether to show runtime info about the detection.
+    :param inplace: whether to label @gazedata itself (no copy at all) or a copy of it.
+    :param snapshots: optional dictionary, if given a copy of the data after each detection stage is stored in it
+                      under the keys 'saccades', 'blinks', 'fixations' and 'pursuits'.
+    :param workers: number of processes for the smooth pursuit clustering, see SmoothPursuitDetector.detect.
+    :return: arff object with the labelled recording.
+
+    """
+    if not inplace:
+        gazedata = copy.deepcopy(gazedata)
+
+    gazedata = DetectPrefilterEvents(gazedata, verbose, snapshots)
+    classifiedgazedata = DetectPursuits(gazedata, verbose, workers=workers)
+    if snapshots is not None:
+        snapshots['pursuits'] = copy.deepcopy(classifiedgazedata)
+
+    return classifiedgazedata
+
+def DetectGazeEventsMultiObserver(gazedatalist, verbose, inplace=False, workers=1):
+    """
+    Run the detection on the recordings of several participants that watched the same stimulus (i.e. the same trial).
+
+    Saccades, blinks and fixations are detected per recording, the smooth pursuit clustering is done on the remaining
+    samples of all recordings together, on their time axis relative to the start of the stimulus. A cluster is only
+    formed where the gaze of enough participants (SPparam["MIN_OBSERVERS"]) moves together; with fewer recordings than
+    that the clustering falls back to SPparam["MIN_PTS"] (see SmoothPursuitDetector.detect).
+    The time axes of the recordings have to start at the same moment of the stimulus: that of the video capture if the
+    recording has one, otherwise the start of the recording (see readers.gaze_columns), which only lines up if all
+    participants started recording at the start of the stimulus.
+
+    :param gazedatalist: list of arff objects of the recordings, as made by readers.gaze_arff.
+    :param verbose: whether to show runtime info about the detection.
+    :param inplace: whether to label the recordings in @gazedatalist themselves (no copy at all) or copies of them.
+    :param workers: number of processes for the smooth pursuit clustering, see SmoothPursuitDetector.detect.
+    :return: list of arff objects with the labelled recordings, in the order of @gazedatalist.
+
+    """
+    if not inplace:
+        gazedatalist = copy.deepcopy(gazedatalist)
+
+    gazedatalist = [DetectPrefilterEvents(gazedata, verbose) for gazedata in gazedatalist]
+    return DetectPursuits(gazedatalist, verbose, multiobserver=True, workers=workers)
+
+def DetectPrefilterEvents(gazedata, verbose, snapshots=None):
+    """
+    Run the saccade, blink and fixation detection on a recording, in place.
+
+    :param gazedata: arff object of the recording, as made by readers.gaze_arff.
+    :param verbose: whether to show runtime info about the detection.
+    :param snapshots: optional dictionary, see DetectGazeEvents.
+    :return: arff object with the labelled recording (@gazedata itself).
+
+    """
+    sacparam = SaccadeParameters(verbose)
+    gazedata = SaccadeDetector(sacparam, gazedata, inplace=True)
+    if snapshots is not None:
+        snapshots['saccades'] = copy.deepcopy(gazedata)
+
+    blkparam = BlinkParameters(verbose)
+    gazedata = BlinkDetector(blkparam, gazedata, inplace=True)
+    if snapshots is not None:
+        snapshots['blinks'] = copy.deepcopy(gazedata)
+
+    fixparam = FixationParameters(verbose)
+    gazedata = FixationDetector(fixparam, gazedata, inplace=True)
+    if snapshots is not None:
+        snapshots['fixations'] = copy.deepcopy(gazedata)
+
+    return gazedata
+
+def DetectPursuits(gazedata, verbose, multiobserver=False, workers=1):
+    """
+    Run the smooth pursuit detection, in place, on the samples that are not labelled by DetectPrefilterEvents.
+
+    :param gazedata: arff object of the recording, or a list of them to cluster together.
+    :param verbose: whether to show runtime info about the detection.
+    :param multiobserver: whether the neighbourhoods are validated by the number of observers (participants) in them
+                          instead of the number of samples.
+    :param workers: number of processes that cluster parts of the time axis in parallel (same result as 1 process).
+    :return: @gazedata with the smooth pursuit labels.
+
+    """
+    SPparam = PursuitParameters(verbose, multiobserver)
+    sp_detector = SmoothPursuitDetector(param=SPparam)
+    return sp_detector.detect(gaze_points_list=gazedata, inplace=True, workers=workers)
+
+def DetectionParameters(verbose=False, multiobserver=False):
+    """
+    Parameters of all detectors, e.g. to record with which parameters a recording was classified.
+
+    :param verbose: whether to show runtime info about the detection.
+    :param multiobserver: whether the smooth pursuit is detected on the recordings of several participants together.
+    :return: dictionary with the sacparam, blkparam, fixparam and SPparam dictionaries.
+
+    """
+    return OrderedDict([('sacparam', SaccadeParameters(verbose)),
+                        ('blkparam', BlinkParameters(verbose)),
+                        ('fixparam', FixationParameters(verbose)),
+                        ('SPparam', PursuitParameters(verbose, multiobserver))])
+
+def SaccadeParameters(verbose):
     # Saccade Detection --------------------------------------------------------------------------------------------------
     sacparam = dict()
     sacparam["THRESHOLD_ONSET_FAST_DEGREE_PER_SEC"] = 137.5  # deg/s
@@ -24,15 +134,17 @@ def DetectGazeEvents(gazedata, verbose):
     sacparam["MAX_DURATION_MILLISEC"] = 160  # milliseconds
     sacparam["VELOCITY_INTEGRAL_INTERVAL_MILLISEC"] = 4  # milliseconds
     sacparam["VERBOSE"] = verbose  # debug mode
-    gazedata = SaccadeDetector(sacparam, gazedata)
+    return sacparam
 
+def BlinkParameters(verbose):
     # Blink detection----------------------------------------------------------------------------------------------------
     blkparam = dict()
     blkparam['MINIMAL_BLINK_DURATION_MILLISEC'] = 20 # milliseconds
     blkparam["MAXIMAL_DISTANCE_TO_SACCADE_MILLISEC"] = 25  # milliseconds
     blkparam["VERBOSE"] = verbose
-    gazedata = BlinkDetector(blkparam, gazedata)
+    return blkparam
 
+def FixationParameters(verbose):
     # Fixation detection-------------------------------------------------------------------------------------------------
     fixparam = dict()
     fixparam["PREFILTERING_INTERVAL_SPREAD_THRESHOLD_DEGREES"] = 1.4142135623730951  # deg
@@ -43,19 +155,17 @@ def DetectGazeEvents(gazedata, verbose):
     fixparam["SLIDING_WINDOW_CRITERION"] = 'speed'  # 'speed' or 'spread'
     fixparam["INTERSACCADIC_INTERVAL_DURATION_THRESHOLD_MILLISEC"] = 75  # milliseconds
     fixparam["VERBOSE"] = verbose  # debug mode
-    gazedata = FixationDetector(fixparam, gazedata)
+    return fixparam
 
+def PursuitParameters(verbose, multiobserver=False):
     # Smooth Pursuit detection-------------------------------------------------------------------------------------------
     SPparam = dict()
     SPparam["MIN_PTS"] = 1  # minimum points for a neighborhood (default value, e.g. 160) * (N_observers / 46.9) * (F_hz / 250)
+    SPparam["MIN_OBSERVERS"] = 2 if multiobserver else None  # minimum observers for a neighborhood, int or fraction
     SPparam["EPS_DEG"] = 4  # deg
     SPparam["TIME_SLICE_MILLISEC"] = 80  # milliseconds
     SPparam["VERBOSE"] = verbose  # debug mode
-
-    sp_detector = SmoothPursuitDetector(param=SPparam)
-    classifiedgazedata = sp_detector.detect(gaze_points_list=gazedata)
-
-    return classifiedgazedata
+    return SPparam
 
 # DEFAULT PARAMETERS
 #
@@ -83,5 +193,6 @@ def DetectGazeEvents(gazedata, verbose):
 #
 #     "SmoothPursuitDetector": {
 #         "min_pts": 1,
+#         "min_observers": 2 (only when the recordings of several participants are clustered together)
 #         "eps_deg": 4.0,
 #         "time_slice_millisec": 80
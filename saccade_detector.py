@@ -1,6 +1,7 @@
 import copy
 import numpy as np
 from arff_helper import ArffHelper
+import labels
 
 def SaccadeDetector(param, gaze_points, inplace=False):
     """
@@ -56,7 +57,7 @@ def SaccadeDetector(param, gaze_points, inplace=False):
     # (default currently set to ~1000 degrees/s) are regarded as glitches and labelled as noise
     is_glitch = np.zeros(gaze_points['data'].shape[0], dtype=np.bool)
     is_glitch[velocities > param["MAX_SPEED_DEGREE_PER_SEC"]] = True
-    gaze_points['data']['EYE_MOVEMENT_TYPE'][velocities > param["MAX_SPEED_DEGREE_PER_SEC"]] = 'NOISE'
+    gaze_points['data']['EYE_MOVEMENT_TYPE'][velocities > param["MAX_SPEED_DEGREE_PER_SEC"]] = labels.NOISE
 
     # Remember first sample after glitch:
     # to prevent saccade detection at the first non-glitch sample
@@ -71,24 +72,57 @@ def SaccadeDetector(param, gaze_points, inplace=False):
     all_glitch = is_glitch + post_glitch + pre_glitch
     # we will assign glitch samples' labels to NOISE after the saccades have been detected
 
-    # recompute speeds for post-glitch samples
+    # recompute speeds for post-glitch samples, all at once
     pre_glitch_indices = np.nonzero(pre_glitch)[0]
-    for i in np.nonzero(post_glitch)[0]:
-        # find the corresponding start of the glitch
-        corresponding_pre_glitch = np.searchsorted(pre_glitch_indices, i) - 1
-        if corresponding_pre_glitch < 0:
-            # no correspondence found, it's the glitch from the beginning of recording ==> set velocity to 0
-            velocities[i] = 0
-        else:
-            # found a completed glitch
-            velocities[i] = np.linalg.norm([
-                gaze_points['data']['x'][i] - gaze_points['data']['x'][corresponding_pre_glitch],
-                gaze_points['data']['y'][i] - gaze_points['data']['y'][corresponding_pre_glitch]
-            ]) / (times[i] - times[corresponding_pre_glitch])
-            velocities[i] *= 1e3  # degrees per second
+    post_glitch_indices = np.nonzero(post_glitch)[0]
+    # find the corresponding start of each glitch (as before, its position in @pre_glitch_indices is used as index)
+    corresponding_pre_glitch = np.searchsorted(pre_glitch_indices, post_glitch_indices) - 1
+    # no correspondence found, it's the glitch from the beginning of recording ==> set velocity to 0
+    velocities[post_glitch_indices[corresponding_pre_glitch < 0]] = 0
+    # found a completed glitch
+    completed = post_glitch_indices[corresponding_pre_glitch >= 0]
+    corresponding_pre_glitch = corresponding_pre_glitch[corresponding_pre_glitch >= 0]
+    velocities[completed] = np.linalg.norm(np.vstack([
+        gaze_points['data']['x'][completed] - gaze_points['data']['x'][corresponding_pre_glitch],
+        gaze_points['data']['y'][completed] - gaze_points['data']['y'][corresponding_pre_glitch]
+    ]), axis=0) / (times[completed] - times[corresponding_pre_glitch])
+    velocities[completed] *= 1e3  # degrees per second
 
     gaze_points['data']['v'] = velocities
 
+    # Precomputed onset/offset borders ----------------------------------------------------------------------------
+    # The onset (offset) of a saccade is found after the last (before the first) sample that does not meet the
+    # onset (offset) criteria, searching back (ahead) from the seed point. Apart from the labels that are assigned
+    # while detecting, these criteria do not change, so for every sample the nearest breaking sample to the left
+    # (right) is computed once for the whole recording.
+    # The labelled saccades (and NOISE episodes) are ordered in time and always end at or after their seed point, so
+    # the only label assigned during the detection that can break an onset search is the end of the last labelled
+    # episode, and none can break an offset search.
+    sample_indices = np.arange(len(velocities))
+    labelled = gaze_points['data']['EYE_MOVEMENT_TYPE'] != labels.UNKNOWN
+    # onset: (1) should be above slow threshold speed, (2) should not be a glitch, (3) does not yet have a label
+    onset_breaks = ~(velocities >= param["THRESHOLD_ONSET_SLOW_DEGREE_PER_SEC"]) | is_glitch | labelled
+    last_onset_break = np.maximum.accumulate(np.where(onset_breaks, sample_indices, -1))
+    # the onset should not be the glitch or post/pre-glitch sample either, find the next sample that is not
+    next_non_glitch = np.minimum.accumulate(np.where(all_glitch, len(velocities), sample_indices)[::-1])[::-1]
+    # offset: (1) should be above offset speed threshold, (2) should not exceed biologically plausible duration
+    # threshold (depends on the onset, see below), (3) should not yet have a label (i.e. not NOISE labelled above).
+    # The speed and duration criteria are ignored around the glitch.
+    around_glitch = is_glitch | post_glitch
+    offset_breaks = labelled | ~((velocities >= param["THRESHOLD_OFFSET_DEGREE_PER_SEC"]) | around_glitch)
+    next_offset_break = np.minimum.accumulate(np.where(offset_breaks, sample_indices, len(velocities))[::-1])[::-1]
+    # samples at which exceeding the duration threshold ends the saccade
+    duration_breaks = ~around_glitch & ~labelled
+    next_duration_break = np.minimum.accumulate(np.where(duration_breaks, sample_indices,
+                                                         len(velocities))[::-1])[::-1]
+    # with sorted timestamps the samples that exceed the duration threshold are all samples from some point on
+    sorted_times = bool(np.all(times[1:] >= times[:-1]))
+    # contiguous copy, so that searching does not convert the timestamps every time
+    contiguous_times = np.ascontiguousarray(times)
+
+    # end of the last episode labelled during the detection
+    last_labelled_end = -1
+
     # Looking for saccade seed points-------------------------------------------------------------------------------
     # saccade seed point should
     # (1) exceed the fast threshold
@@ -99,61 +133,39 @@ def SaccadeDetector(param, gaze_points, inplace=False):
                     (1 - all_glitch)
     saccade_seed_indices = np.nonzero(saccade_seeds)[0]
     for potential_seed_index in saccade_seed_indices:
-        if gaze_points['data']['EYE_MOVEMENT_TYPE'][potential_seed_index] != 'UNKNOWN':
+        if gaze_points['data']['EYE_MOVEMENT_TYPE'][potential_seed_index] != labels.UNKNOWN:
             # already labelled this before, ex. as a saccade that started from another seed point
             continue
         if param["VERBOSE"] == True:
             print('potential seed index', potential_seed_index)
-        # Looking for onset:
-        # (1) should be above slow threshold speed
-        # (2) should not be a glitch
-        # (3) does not yet have a label
-        onset_candidates_check = (velocities[max(0, potential_seed_index - extra_samples_count):potential_seed_index] >=
-                                  param["THRESHOLD_ONSET_SLOW_DEGREE_PER_SEC"]) * \
-                                 (1 - is_glitch[
-                                      max(0, potential_seed_index - extra_samples_count):potential_seed_index]) * \
-                                 (gaze_points['data']['EYE_MOVEMENT_TYPE'][
-                                  max(0, potential_seed_index - extra_samples_count):potential_seed_index
-                                  ] == 'UNKNOWN')
-
-        # find the last zero (the next sample after it is the beginning of the last uninterrupted 1-sequence,
-        # i.e. the saccade onset
-        try:
-            last_zero_index = np.nonzero(1 - onset_candidates_check)[0][-1]
-        except IndexError:
+        # Looking for onset: the last breaking sample in the search window (the next sample after it is the beginning
+        # of the last uninterrupted sequence of onset candidates, i.e. the saccade onset)
+        window_start = max(0, potential_seed_index - extra_samples_count)
+        last_zero_index = last_labelled_end
+        if potential_seed_index > 0:
+            last_zero_index = max(last_zero_index, last_onset_break[potential_seed_index - 1])
+        if last_zero_index < window_start:
             # not found
             continue
-        saccade_onset_index = last_zero_index + 1 + max(0,
-                                                        potential_seed_index - extra_samples_count)  # shift accordingly
-        # also this should not be the glitch or post/pre-glitch sample
-        while all_glitch[saccade_onset_index]:
-            saccade_onset_index += 1
-
-        # looking for offset
-        # (1) should be above offset speed threshold
-        # (2) should not exceed biologically plausible duration threshold
-        # (3) should not yet have a label (i.e. not NOISE labelled above)
-        offset_candidates_check = (velocities[potential_seed_index:potential_seed_index + extra_samples_count] >=
-                                   param["THRESHOLD_OFFSET_DEGREE_PER_SEC"]) * \
-                                  (times[potential_seed_index:potential_seed_index + extra_samples_count] -
-                                   times[saccade_onset_index] <= param["MAX_DURATION_MILLISEC"])
-        # we ignore the criterion around the glitch
-        offset_candidates_check += is_glitch[potential_seed_index:potential_seed_index + extra_samples_count]
-        offset_candidates_check += post_glitch[potential_seed_index:potential_seed_index + extra_samples_count]
-
-        # but there should not yet be a label present, i.e. it's not the NOISE labelled above
-        offset_candidates_check *= (gaze_points['data']['EYE_MOVEMENT_TYPE'][
-                                    potential_seed_index:potential_seed_index + extra_samples_count
-                                    ] == 'UNKNOWN')
-
-        # find the first zero (this is the first sample with speed below the threshold, i.e. the saccade offset
-        try:
-            saccade_offset_index = np.nonzero(1 - offset_candidates_check)[0][0]
-        except IndexError:
+        saccade_onset_index = next_non_glitch[last_zero_index + 1]
+
+        # looking for offset: the first breaking sample in the search window (this is the first sample with speed
+        # below the threshold, i.e. the saccade offset)
+        window_end = min(potential_seed_index + extra_samples_count, len(velocities))
+        saccade_offset_index = next_offset_break[potential_seed_index]
+        # the first sample after the seed point that exceeds the maximal duration
+        if sorted_times:
+            too_long_index = _first_exceeding(contiguous_times, saccade_onset_index, param["MAX_DURATION_MILLISEC"])
+            too_long_index = max(too_long_index, potential_seed_index)
+        else:
+            too_long = ~(times[potential_seed_index:window_end] - times[saccade_onset_index] <=
+                         param["MAX_DURATION_MILLISEC"])
+            too_long_index = potential_seed_index + np.append(np.nonzero(too_long)[0], len(too_long))[0]
+        if too_long_index < len(velocities):
+            saccade_offset_index = min(saccade_offset_index, next_duration_break[too_long_index])
+        if saccade_offset_index >= window_end:
             # no offset found
             continue
-        # the index was starting at potential_seed_index
-        saccade_offset_index += potential_seed_index
 
         # if we are finished inside the glitch, we have reached a biological limit of some sorts ==> discard
         if is_glitch[saccade_offset_index]:
@@ -169,7 +181,8 @@ def SaccadeDetector(param, gaze_points, inplace=False):
             # If the resulting saccade is shorter than
             # a minDuration, we assume that we have only encountered
             # some noise impulse and discard this saccade.
-            gaze_points['data']['EYE_MOVEMENT_TYPE'][saccade_onset_index:saccade_offset_index + 1] = 'NOISE'
+            gaze_points['data']['EYE_MOVEMENT_TYPE'][saccade_onset_index:saccade_offset_index + 1] = labels.NOISE
+            last_labelled_end = saccade_offset_index
 
             if param["VERBOSE"] == True:
                 print('Discarding due to low duration: needed {}, had {}'. \
@@ -194,7 +207,8 @@ def SaccadeDetector(param, gaze_points, inplace=False):
             continue
 
         # If all is okay, we detected a whole saccade
-        gaze_points['data']['EYE_MOVEMENT_TYPE'][saccade_onset_index:saccade_offset_index + 1] = 'SACCADE'
+        gaze_points['data']['EYE_MOVEMENT_TYPE'][saccade_onset_index:saccade_offset_index + 1] = labels.SACCADE
+        last_labelled_end = saccade_offset_index
         # write the saccade index into the appropriate field and update the global count
         gaze_points['data']['SACC_INTERVAL_INDEX'][saccade_onset_index:saccade_offset_index + 1] = \
             detected_saccades_count
@@ -221,6 +235,25 @@ def SaccadeDetector(param, gaze_points, inplace=False):
     intersaccadic_intervals_count += 1
 
     # Override erroneous samples' labels
-    gaze_points['data']['EYE_MOVEMENT_TYPE'][is_glitch] = 'NOISE'
+    gaze_points['data']['EYE_MOVEMENT_TYPE'][is_glitch] = labels.NOISE
 
     return gaze_points
+
+def _first_exceeding(times, onset_index, max_duration):
+    """
+    Find the first sample that is more than @max_duration after the sample @onset_index, in sorted @times.
+    The duration is compared exactly as in the offset search, i.e. as difference of the (float32) timestamps.
+
+    :param times: sorted timestamps.
+    :param onset_index: index of the onset sample.
+    :param max_duration: maximal duration.
+    :return: index of the first sample that exceeds the duration, len(@times) if there is none.
+
+    """
+    index = int(np.searchsorted(times, times.dtype.type(times[onset_index] + max_duration), side='right'))
+    # correct the search for the rounding of the timestamp differences
+    while index > 0 and not (times[index - 1] - times[onset_index] <= max_duration):
+        index -= 1
+    while index < len(times) and times[index] - times[onset_index] <= max_duration:
+        index += 1
+    return index
@@ -0,0 +1,149 @@
+import numpy as np
+
+"""
+Multi-resolution summary of the signals of a recording, for plotting long recordings.
+
+A SignalPyramid summarizes the time series x, y and v of a recording in levels of buckets: level 0 are the samples
+themselves, every next level combines PYRAMID_FACTOR buckets of the level below. A bucket keeps the minimum and the
+maximum of every signal (with the time at which they occur) and its mean. Drawn as a line through the minimum and the
+maximum of every bucket, in the order in which they occur, a level looks the same as the samples as long as there
+are at least as many buckets as pixels, so a plot only needs the coarsest level that still has that many buckets.
+"""
+
+# number of buckets of a level that are combined into a bucket of the next level
+PYRAMID_FACTOR = 4
+# no coarser levels are made once a level has fewer buckets than this
+MIN_BUCKETS = 256
+# signals that are summarized
+SIGNALS = ('x', 'y', 'v')
+
+
+class SignalPyramid(object):
+    """
+    Min/max/mean pyramid of the x, y and v signals of a recording (see the module description).
+
+    Every level above 0 is a dictionary with, per signal, the arrays <signal>_min, <signal>_min_time, <signal>_max,
+    <signal>_max_time and <signal>_mean, with a value per bucket (nan for buckets of only nan samples).
+    """
+    def __init__(self, t, x, y, v, factor=PYRAMID_FACTOR, min_buckets=MIN_BUCKETS):
+        self.t = t
+        self.signals = {'x': x, 'y': y, 'v': v}
+        self.factor = factor
+        self.levels = [None]
+        # per signal: minimum, time of the minimum, maximum, time of the maximum, sum and count of the non nan values
+        summary = dict()
+        for name in SIGNALS:
+            values = self.signals[name]
+            is_nan = np.isnan(values)
+            summary[name] = (values, t, values, t, np.where(is_nan, 0, values), (~is_nan).astype(np.int64))
+
+        length = len(t)
+        while length >= min_buckets * factor and length > factor:
+            level = dict()
+            for name in SIGNALS:
+                summary[name] = _combine(*summary[name], factor=factor)
+                minimum, min_time, maximum, max_time, sums, counts = summary[name]
+                level[name + '_min'] = minimum
+                level[name + '_min_time'] = min_time
+                level[name + '_max'] = maximum
+                level[name + '_max_time'] = max_time
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    level[name + '_mean'] = (sums / counts).astype(minimum.dtype)
+            self.levels.append(level)
+            length = self.buckets(len(self.levels) - 1)
+
+    def buckets(self, level):
+        """
+        Number of buckets of a level.
+        """
+        return len(self.t) if level == 0 else len(self.levels[level][SIGNALS[0] + '_min'])
+
+    def level_for(self, pixels):
+        """
+        Coarsest level with at least @pixels buckets, or 0 (the samples) if there is none.
+
+        :param pixels: number of pixels the signal is drawn on.
+        :return: index of the level.
+
+        """
+        level = 0
+        while level + 1 < len(self.levels) and self.buckets(level + 1) >= pixels:
+            level += 1
+        return level
+
+    def line(self, name, pixels):
+        """
+        Points to draw a signal on @pixels pixels: the samples, or the minimum and maximum of every bucket of
+        the level for @pixels, ordered by their time.
+
+        :param name: name of the signal ('x', 'y' or 'v').
+        :param pixels: number of pixels the signal is drawn on.
+        :return: tuple of the times and values of the points.
+
+        """
+        level = self.level_for(pixels)
+        if level == 0:
+            return self.t, self.signals[name]
+
+        summary = self.levels[level]
+        times = np.column_stack([summary[name + '_min_time'], summary[name + '_max_time']])
+        values = np.column_stack([summary[name + '_min'], summary[name + '_max']])
+        swap = summary[name + '_max_time'] < summary[name + '_min_time']
+        times[swap] = times[swap, ::-1]
+        values[swap] = values[swap, ::-1]
+        return times.ravel(), values.ravel()
+
+
+def _combine(minimum, min_time, maximum, max_time, sums, counts, factor):
+    """
+    Combine every @factor buckets of a level (or samples) into a bucket of the next level.
+
+    :return: tuple of the minimum, time of the minimum, maximum, time of the maximum, sum and count of the non nan
+             values of the new buckets.
+
+    """
+    buckets = -(-len(minimum) // factor)
+    padding = buckets * factor - len(minimum)
+
+    def grouped(values, fill):
+        return np.concatenate([values, np.full(padding, fill, dtype=values.dtype)]).reshape(buckets, factor)
+
+    # nan values never are the minimum or maximum of a bucket, unless all its values are nan
+    mins = grouped(np.where(np.isnan(minimum), np.inf, minimum), np.inf)
+    maxs = grouped(np.where(np.isnan(maximum), -np.inf, maximum), -np.inf)
+    rows = np.arange(buckets)
+    argmin = mins.argmin(axis=1)
+    argmax = maxs.argmax(axis=1)
+    new_minimum = mins[rows, argmin]
+    new_maximum = maxs[rows, argmax]
+    new_min_time = grouped(min_time, np.nan)[rows, argmin]
+    new_max_time = grouped(max_time, np.nan)[rows, argmax]
+
+    empty = np.isinf(new_minimum)
+    new_minimum[empty] = np.nan
+    new_maximum[empty] = np.nan
+    new_min_time[empty] = np.nan
+    new_max_time[empty] = np.nan
+
+    return (new_minimum, new_min_time, new_maximum, new_max_time,
+            grouped(sums, 0).sum(axis=1), grouped(counts, 0).sum(axis=1))
+
+def merge_spans(starts, ends, resolution):
+    """
+    Merge time spans that are less than @resolution apart, e.g. less than a pixel when drawn.
+
+    :param starts: start times of the spans, in increasing order.
+    :param ends: end times of the spans.
+    :param resolution: smallest gap between spans that is kept.
+    :return: tuple of the start and end times of the merged spans.
+
+    """
+    starts = np.asarray(starts)
+    ends = np.asarray(ends)
+    if len(starts) == 0:
+        return starts, ends
+    # a span starts a new merged span if it is at least @resolution after the end of every earlier span
+    first = np.ones(len(starts), dtype=bool)
+    first[1:] = starts[1:] - np.maximum.accumulate(ends)[:-1] >= resolution
+    groups = np.flatnonzero(first)
+    return starts[groups], np.maximum.reduceat(ends, groups)
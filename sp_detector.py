@@ -1,15 +1,25 @@
 import numpy as np
 import abc
 import copy
+import math
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 
 from arff import xrange
 from arff_helper import ArffHelper
+import labels
+
+# maximal number of candidate point pairs in a block of points whose neighbourhoods are computed at once
+NEIGHBOURHOOD_BATCH_PAIRS = 2 ** 22
+# minimal number of points per worker process of the parallel clustering, smaller data sets use fewer processes
+PARALLEL_MIN_POINTS = 2 ** 14
 
 
 class SmoothPursuitDetector(object):
     """
-    DBSCAN-based smooth pursuit detector. All the logic is in a DBSCANWithMinPts class, this is just a wrapper
-    that based on the arguments to __init__ method initiates DBSCANWithMinPts
+    DBSCAN-based smooth pursuit detector. All the logic is in the DBSCANWithMinPts and DBSCANWithMinObservers classes,
+    this is just a wrapper that based on the arguments to __init__ method initiates one of them
     """
     def __init__(self, param):
         """
@@ -21,17 +31,47 @@ class SmoothPursuitDetector(object):
                                     Value is given in milliseconds. The neighbourhood essentially has cylindrical shape.
         :param min_pts: of points required to  form a "valid" neighbourhood
                             (that integer indicating the minimum number of a core points).
+        :param min_observers: (optional) number of observers required to form a "valid" neighbourhood, either an
+                              integer or a fraction of the number of recordings that are clustered together.
+                              If given, DBSCANWithMinObservers is used instead of DBSCANWithMinPts, unless fewer
+                              recordings than that are clustered together (see detect).
         """
-        min_pts = param['MIN_PTS']
         eps_deg = param['EPS_DEG']
         time_slice_millisec = param['TIME_SLICE_MILLISEC']
 
-        self.clustering = DBSCANWithMinPts(eps_deg=eps_deg, time_slice_millisec=time_slice_millisec,
-                                               min_pts=min_pts)
+        self.min_pts_clustering = DBSCANWithMinPts(eps_deg=eps_deg, time_slice_millisec=time_slice_millisec,
+                                                   min_pts=param['MIN_PTS'])
+        if param.get('MIN_OBSERVERS') is not None:
+            self.clustering = DBSCANWithMinObservers(eps_deg=eps_deg, time_slice_millisec=time_slice_millisec,
+                                                     min_observers=param['MIN_OBSERVERS'])
+        else:
+            self.clustering = self.min_pts_clustering
+
+    def detect(self, gaze_points_list, inplace=False, workers=1):
+        """
+        Detect smooth pursuit in a recording or a list of recordings, see DBSCANWithTimeSlice.cluster.
 
-    def detect(self, gaze_points_list, inplace=False):
-        return self.clustering.cluster(gaze_points_list=gaze_points_list,
-                                       inplace=inplace)
+        If the neighbourhoods are validated by the number of observers, but there are fewer recordings than
+        the minimal number of observers (e.g. a trial that only one participant did), no cluster could ever be formed.
+        Those recordings are clustered with DBSCANWithMinPts instead, and a warning is shown.
+
+        :param gaze_points_list: a list of arff objects, or a single arff object.
+        :param inplace: whether to modify the original input gaze data or use a copy.
+        :param workers: number of processes that cluster parts of the time axis in parallel, the result is the same
+                        as with 1 (serial clustering).
+        :return: gaze data after clustering in the same form as the input data.
+
+        """
+        clustering = self.clustering
+        observers = 1 if isinstance(gaze_points_list, dict) else len(gaze_points_list)
+        if isinstance(clustering, DBSCANWithMinObservers) and observers < clustering.required_observers(observers):
+            print('Warning: only {} recording(s) to cluster together, fewer than the minimal number of observers '
+                  '({}). The smooth pursuit is detected with MIN_PTS instead.'.format(
+                      observers, clustering.required_observers(observers)))
+            clustering = self.min_pts_clustering
+        return clustering.cluster(gaze_points_list=gaze_points_list,
+                                  inplace=inplace,
+                                  workers=workers)
 
 
 class DBSCANWithTimeSlice(object):
@@ -69,90 +109,288 @@ class DBSCANWithTimeSlice(object):
 
         # initialize empty data
         self._data_set = None
-        # store timestamps separately for efficiency
+        # store timestamps and coordinates separately for efficiency
         self._timestamps = None
-
-    def cluster(self, gaze_points_list, inplace=False):
+        self._x = None
+        self._y = None
+        # range of the points in the time slice around every point
+        self._candidate_starts = None
+        self._candidate_ends = None
+        # the neighbourhoods are computed per block of consecutive points (see _build_neighbourhood_index)
+        self._block_edges = None
+        self._point_blocks = None
+        self._block_requests = None
+        self._blocks = None
+        # marks the points that are already in the neighbourhood of the cluster that is being expanded
+        self._queued = None
+
+    def cluster(self, gaze_points_list, inplace=False, workers=1):
         """
         Find clusters of input gaze data and label clustered points as smooth pursuit.
         Labels (sets the 'EYE_MOVEMENT_TYPE' field) the clusters of data points as 'SP',
         other samples as 'NOISE_CLUSTER'.
 
+        The UNKNOWN samples of all recordings in @gaze_points_list (e.g. the recordings of all participants that
+        watched the same stimulus) are clustered together, on the time axis of the recordings, which is relative to
+        the start of the stimulus (or recording). Clusters can therefore span several recordings. The time axes of
+        the recordings are not aligned here, they have to start at the same moment of the stimulus.
+
         New column 'CLUSTER_ID' is added into the @DATA section of each arff object in @gaze_points_list,
         indicating cluster group ID.
 
-        :param gaze_points_list: a list of arff objects (dictionary with fields such as 'data' and 'metadata')
+        :param gaze_points_list: a list of arff objects (dictionary with fields such as 'data' and 'metadata'),
+                                 or a single arff object
         :param inplace: whether to modify the original input gaze data with gaze data after clustering or use a copy
+        :param workers: number of processes that cluster parts of the time axis in parallel (see _cluster_parallel),
+                        1 for serial clustering.
         :return: gaze data after clustering in the same form as the input data.
 
         """
         if not inplace:
             gaze_points_list = copy.deepcopy(gaze_points_list)
+        recordings = [gaze_points_list] if isinstance(gaze_points_list, dict) else gaze_points_list
 
-        # add global indexing to be able to reference the particular sample even after clustering all in one structure
-        ArffHelper.add_column(gaze_points_list, name='global_index', dtype='INTEGER', default_value=-1)
-        gaze_points_list['data']['global_index'] = np.arange(gaze_points_list['data'].shape[0])
+        self._setup_internal_parameters(recordings)
+        self._data_set = self._aggregate_data(recordings)
+        self._build_neighbourhood_index()
 
-        self._data_set = self._aggregate_data(gaze_points_list)
-        # has to be a copy, so that is is placed continuously in memory
-        self._timestamps = self._data_set['time'].copy()
+        workers = min(workers, len(self._data_set) // PARALLEL_MIN_POINTS)
+        if workers > 1 and self._neighbourhoods_are_symmetric():
+            self._cluster_parallel(workers)
+        else:
+            self._cluster_serial()
+
+        # drop the neighbourhoods that were not requested (if any)
+        self._blocks = None
+
+        for observer_id, recording in enumerate(recordings):
+            # reset the CLUSTER_ID column of the recording (only arff objects without it get a new column)
+            if 'CLUSTER_ID' in recording['data'].dtype.names:
+                recording['data']['CLUSTER_ID'] = -1
+            else:
+                ArffHelper.add_column(recording, 'CLUSTER_ID', 'NUMERIC', -1)
+
+            # label data in the recording as SP according to CLUSTER_ID
+            samples = self._data_set[self._data_set['observer_id'] == observer_id]
+            global_index = samples['global_index']
+            cluster_ids = samples['CLUSTER_ID']
+            clustered = cluster_ids != -1
+            recording['data']['EYE_MOVEMENT_TYPE'][global_index] = np.where(clustered, labels.SP,
+                                                                            labels.NOISE_CLUSTER)
+            recording['data']['CLUSTER_ID'][global_index[clustered]] = cluster_ids[clustered]
+
+        return gaze_points_list
+
+    def _cluster_serial(self):
+        """
+        Run DBSCAN on self._data_set (a 7-column numpy array as data set to be clustered), i.e. fill in its
+        'CLUSTER_ID' and 'visited_flag' columns.
+
+        """
+        self._queued = np.zeros(len(self._data_set), dtype=bool)
+        visited = self._data_set['visited_flag']
 
         current_cluster_id = 0
 
         for i in xrange(len(self._data_set)):
-            if self._data_set[i]['visited_flag'] == 1:
+            if visited[i] == 1:
                 continue
             else:
-                self._data_set[i]['visited_flag'] = 1
+                visited[i] = 1
                 neighbourhood = self._get_neighbourhood(i)
                 if self._validate_neighbourhood(neighbourhood):
                     # if not: mark current point as NOISE
                     self._expand_cluster(i, neighbourhood, current_cluster_id)
                     current_cluster_id += 1
 
-        # create a new column in gaze_points_list for CLUSTER_ID
-        ArffHelper.add_column(gaze_points_list, 'CLUSTER_ID', 'NUMERIC', -1)
+    def _cluster_parallel(self, workers):
+        """
+        Run DBSCAN on self._data_set (a 7-column numpy array as data set to be clustered) in @workers processes,
+        with the same result as self._cluster_serial().
 
-        # label data in gaze_points_list as SP according to CLUSTER_ID
-        for i in xrange(len(self._data_set)):
-            global_index = self._data_set[i]['global_index']
+        The data set is split into partitions of consecutive points (i.e. parts of the time axis). Since a neighbourhood
+        never reaches further than one time slice, a partition only needs the points up to two time slices around
+        it to find its core points and the clusters they form (see _cluster_partition). Clusters of different
+        partitions that share a core point in the overlap are merged afterwards.
 
-            if self._data_set[i]['CLUSTER_ID'] != -1:
-                gaze_points_list['data']['EYE_MOVEMENT_TYPE'][global_index] = 'SP'
-                gaze_points_list['data']['CLUSTER_ID'][global_index] = self._data_set[i]['CLUSTER_ID']
-            else:
-                gaze_points_list['data']['EYE_MOVEMENT_TYPE'][global_index] = 'NOISE_CLUSTER'
+        For symmetric neighbourhoods, serial DBSCAN forms a cluster for every connected group of core points, numbered
+        in order of the first core point of each group, and border points (not core points themselves) are assigned
+        to the cluster with the lowest id that has a core point in their neighbourhood. This is reproduced here.
 
-        # can now remove the global_index column
-        ArffHelper.remove_column(gaze_points_list, name='global_index')
+        :param workers: number of processes.
 
-        return gaze_points_list
+        """
+        partition_edges = np.linspace(0, len(self._data_set), workers + 1).astype(int)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            jobs = []
+            for start, end in zip(partition_edges[:-1], partition_edges[1:]):
+                # points in the neighbourhoods of the partition, and the points needed for their neighbourhoods
+                node_start = self._candidate_starts[start]
+                node_end = self._candidate_ends[end - 1]
+                first = self._candidate_starts[node_start]
+                last = self._candidate_ends[node_end - 1]
+
+                partition = self._partition(first, last)
+                jobs.append((first, executor.submit(partition._cluster_partition, start - first, end - first,
+                                                    node_start - first, node_end - first)))
+            results = [(first, job.result()) for first, job in jobs]
+
+        # merge the local clusters of all partitions (numbered consecutively over the partitions): a local cluster
+        # that contains a core point of another partition is linked to the local cluster of that point
+        core = []
+        local_clusters = []
+        link_points = []
+        link_clusters = []
+        border_points = []
+        border_core_points = []
+        local_cluster_count = 0
+        for first, (partition_core, clusters, cluster_count, links, links_clusters, borders, borders_core) in results:
+            core.append(partition_core)
+            local_clusters.append(clusters + local_cluster_count)
+            link_points.append(links + first)
+            link_clusters.append(links_clusters + local_cluster_count)
+            border_points.append(borders + first)
+            border_core_points.append(borders_core + first)
+            local_cluster_count += cluster_count
+        core = np.concatenate(core)
+        local_clusters = np.concatenate(local_clusters)
+        link_points = np.concatenate(link_points)
+        link_clusters = np.concatenate(link_clusters)
+        border_points = np.concatenate(border_points)
+        border_core_points = np.concatenate(border_core_points)
+
+        links = csr_matrix((np.ones(len(link_points), dtype=bool), (link_clusters, local_clusters[link_points])),
+                           shape=(local_cluster_count, local_cluster_count))
+        group_count, local_cluster_groups = connected_components(links, directed=False)
+        groups = local_cluster_groups[local_clusters]
+
+        # number the groups of core points (the clusters) in order of their first core point
+        core_points = np.nonzero(core)[0]
+        first_core_points = np.full(group_count, len(core))
+        np.minimum.at(first_core_points, groups[core_points], core_points)
+        group_cluster_ids = np.empty(group_count, dtype=int)
+        group_cluster_ids[np.argsort(first_core_points, kind='stable')] = np.arange(group_count)
+
+        cluster_ids = np.full(len(core), -1)
+        cluster_ids[core_points] = group_cluster_ids[groups[core_points]]
+        border_cluster_ids = np.full(len(core), len(core))
+        np.minimum.at(border_cluster_ids, border_points, group_cluster_ids[groups[border_core_points]])
+        is_border = ~core & (border_cluster_ids < len(core))
+        cluster_ids[is_border] = border_cluster_ids[is_border]
+
+        self._data_set['CLUSTER_ID'] = cluster_ids
+        self._data_set['visited_flag'] = 1
+
+    def _partition(self, first, last):
+        """
+        Copy of this object for clustering a part of self._data_set in a worker process. Only the parameters and
+        the points are copied, the neighbourhood index is built again by the worker.
+
+        :param first: index of the first point of the part.
+        :param last: index after the last point of the part.
+        :return: object of the same class, with the points of the part as data set.
+
+        """
+        partition = copy.copy(self)
+        partition._data_set = self._data_set[first:last].copy()
+        partition._timestamps = partition._x = partition._y = None
+        partition._candidate_starts = partition._candidate_ends = None
+        partition._block_edges = partition._point_blocks = partition._block_requests = partition._blocks = None
+        partition._queued = None
+        return partition
+
+    def _cluster_partition(self, start, end, node_start, node_end):
+        """
+        Find the core points of a partition of self._data_set (a 7-column numpy array with the points of the
+        partition and the points up to two time slices around it) and group them into local clusters.
+        Runs in a worker process of _cluster_parallel.
+
+        :param start: index of the first point of the partition.
+        :param end: index after the last point of the partition.
+        :param node_start: index of the first point in a neighbourhood of the partition.
+        :param node_end: index after the last point in a neighbourhood of the partition.
+        :return: tuple of
+                 - whether the points of the partition are core points (bool array),
+                 - the local cluster of the points of the partition (every point that is not a core point and not
+                   connected to one is a local cluster of its own), and the number of local clusters,
+                 - the core points outside the partition that are in a local cluster, and these local clusters,
+                 - the border points of the partition, and for each of them one core point in their neighbourhood
+                   per local cluster (two arrays with a border point and a core point per entry).
+
+        """
+        self._build_neighbourhood_index()
+
+        core = np.zeros(node_end - node_start, dtype=bool)
+        neighbourhoods = []
+        for i in xrange(node_start, node_end):
+            neighbourhood = self._get_neighbourhood(i)
+            core[i - node_start] = self._validate_neighbourhood(neighbourhood)
+            if start <= i < end:
+                neighbourhoods.append(neighbourhood)
+
+        # neighbour pairs of the partition, as indices relative to node_start
+        points = np.repeat(np.arange(start, end), [len(neighbourhood) for neighbourhood in neighbourhoods])
+        points -= node_start
+        neighbours = np.concatenate(neighbourhoods) - node_start
+        core_point = core[points]
+        core_neighbour = core[neighbours]
+
+        # local clusters: core points of the partition connected to each other and to the core points in their
+        # neighbourhoods
+        edges = core_point & core_neighbour
+        graph = csr_matrix((np.ones(np.count_nonzero(edges), dtype=bool), (points[edges], neighbours[edges])),
+                           shape=(len(core), len(core)))
+        cluster_count, clusters = connected_components(graph, directed=False)
+
+        links = np.unique(neighbours[edges])
+        links = links[(links < start - node_start) | (links >= end - node_start)]
+
+        # border points, with one core neighbour per local cluster
+        borders = ~core_point & core_neighbour
+        border_points = points[borders]
+        border_core_points = neighbours[borders]
+        _, unique = np.unique(np.vstack([border_points, clusters[border_core_points]]), axis=1, return_index=True)
+
+        owned = slice(start - node_start, end - node_start)
+        return (core[owned], clusters[owned], cluster_count, links + node_start, clusters[links],
+                border_points[unique] + node_start, border_core_points[unique] + node_start)
 
     def _expand_cluster(self, current_point, neighbourhood, current_cluster_id):
         """
         Check all points within neighbourhood of current core point in order
         to expand neighbourhood. Processes points in the @self._data_set
-        (a 6-column numpy array as data set to be clustered)
+        (a 7-column numpy array as data set to be clustered)
+
+        The neighbourhood is expanded breadth-first: every point is queued at most once (marked in self._queued),
+        and the neighbourhood of every point is requested at most once (when it is first visited).
 
         :param current_point: index of the current core point.
-        :param neighbourhood: index list as neighbourhood of current core point.
+        :param neighbourhood: index array as neighbourhood of current core point.
         :param current_cluster_id: index of current cluster.
-        :return: index list of expanded neighbourhood points.
+        :return: index array of expanded neighbourhood points.
 
         """
-
-        self._data_set[current_point]['CLUSTER_ID'] = current_cluster_id
-        for neighbour in neighbourhood:
-            if self._data_set[neighbour]['visited_flag'] == 0:
-                self._data_set[neighbour]['visited_flag'] = 1
+        visited = self._data_set['visited_flag']
+        self._queued[neighbourhood] = True
+        queue = neighbourhood.tolist()
+
+        # the queue grows while it is processed
+        for neighbour in queue:
+            if visited[neighbour] == 0:
+                visited[neighbour] = 1
                 new_neighbourhood = self._get_neighbourhood(neighbour)  # eps as input parameter
                 if self._validate_neighbourhood(new_neighbourhood):
-                    new_neighbourhood_set = set(new_neighbourhood)
-                    new_neighbours = list(new_neighbourhood_set.difference(neighbourhood))
-                    neighbourhood.extend(new_neighbours)    # something wrong if use neighbourhood_set.update
+                    new_neighbours = new_neighbourhood[~self._queued[new_neighbourhood]]
+                    self._queued[new_neighbours] = True
+                    queue.extend(new_neighbours.tolist())
+
+        neighbourhood = np.array(queue, dtype=neighbourhood.dtype)
+        self._queued[neighbourhood] = False
 
-            if self._data_set[neighbour]['CLUSTER_ID'] == -1:
-                self._data_set[neighbour]['CLUSTER_ID'] = current_cluster_id
+        # points that are not in a cluster yet (i.e. all but the border points of earlier clusters) join this one
+        cluster_ids = self._data_set['CLUSTER_ID']
+        cluster_ids[current_point] = current_cluster_id
+        cluster_ids[neighbourhood[cluster_ids[neighbourhood] == -1]] = current_cluster_id
 
         return neighbourhood
 
@@ -162,43 +400,134 @@ class DBSCANWithTimeSlice(object):
         new data set in form of a numpy array.
 
         :param gaze_points_list: gaze data to be clustered in form of list of arff objects.
-        :return: data set to be clustered in form of a 6-column numpy array,
-                 i.e. ['time','x','y','observer_id','CLUSTER_ID','visited_flag'],
+        :return: data set to be clustered in form of a 7-column numpy array,
+                 i.e. ['time','x','y','observer_id','global_index','CLUSTER_ID','visited_flag'],
                  ordered by 'time' column value.
 
         """
-        data_set = []
-        gaze_points_data = gaze_points_list['data'][
-            (gaze_points_list['data']['EYE_MOVEMENT_TYPE'] == 'UNKNOWN')][['time', 'x', 'y', 'global_index']]
-        gaze_points_data = ArffHelper.add_column_to_array(gaze_points_data, 'CLUSTER_ID', 'NUMERIC', -1)
-        gaze_points_data = ArffHelper.add_column_to_array(gaze_points_data, 'visited_flag', 'NUMERIC', 0)
-        if len(gaze_points_data) > 0:
-            data_set.append(gaze_points_data)
-        data_set = np.concatenate(data_set)
+        # the global index references the particular sample in its arff object (the observer id references the
+        # object in @gaze_points_list) even after clustering
+        global_indices = [np.nonzero(gaze_points['data']['EYE_MOVEMENT_TYPE'] == labels.UNKNOWN)[0]
+                          for gaze_points in gaze_points_list]
+
+        # allocate the data set once and fill it per recording and column
+        numeric = ArffHelper._convert_dtype_to_numpy('NUMERIC')
+        integer = ArffHelper._convert_dtype_to_numpy('INTEGER')
+        data_set = np.empty(sum(len(global_index) for global_index in global_indices),
+                            dtype=[('time', numeric),
+                                   ('x', numeric),
+                                   ('y', numeric),
+                                   ('observer_id', integer),
+                                   ('global_index', integer),
+                                   ('CLUSTER_ID', numeric),
+                                   ('visited_flag', numeric)])
+        start = 0
+        for observer_id, (gaze_points, global_index) in enumerate(zip(gaze_points_list, global_indices)):
+            samples = data_set[start:start + len(global_index)]
+            for column in ['time', 'x', 'y']:
+                samples[column] = gaze_points['data'][column][global_index]
+            samples['observer_id'] = observer_id
+            samples['global_index'] = global_index
+            start += len(global_index)
+        data_set['CLUSTER_ID'] = -1
+        data_set['visited_flag'] = 0
         data_set = np.sort(data_set, order='time')
 
         return data_set
 
-    def _get_neighbourhood(self, current_point):
+    def _build_neighbourhood_index(self):
         """
-        Get neighbourhood of current point in self._data_set (a 6-column numpy array as data set to be clustered)
+        Prepare the neighbourhood search in self._data_set (a 7-column numpy array as data set to be clustered).
 
-        :param current_point: index of the current core point candidate.
-        :return: index list of the neighbourhood of current point.
+        The neighbourhood of a point are all points within the time slice around it (found by binary search in the
+        sorted timestamps) that are not more than @self.eps_deg away in the XY-plane, in the order of the data set.
+        The time slices of all points are found here, the neighbourhoods themselves are computed (in CSR form) per
+        block of consecutive points when the first neighbourhood of the block is requested. A block has at most
+        NEIGHBOURHOOD_BATCH_PAIRS candidate pairs (or a single point). The neighbourhood of every point is requested
+        only once during the clustering, so a block is dropped when all of its neighbourhoods have been requested.
+        This way the memory use is bounded even when many recordings are clustered together.
 
         """
+        # has to be a copy, so that is is placed continuously in memory
+        self._timestamps = self._data_set['time'].copy()
+        self._x = self._data_set['x'].copy()
+        self._y = self._data_set['y'].copy()
+
         # cast to the appropriate type just in case
-        start_index = np.searchsorted(self._timestamps,
-                                      self._timestamps[current_point] - self._timestamps.dtype.type(self.time_slice),
-                                      side='left')
-        end_index = np.searchsorted(self._timestamps,
-                                    self._timestamps[current_point] + self._timestamps.dtype.type(self.time_slice),
-                                    side='right')
-
-        distance = np.linalg.norm([self._data_set[start_index:end_index]['x'] - self._data_set[current_point]['x'],
-                                   self._data_set[start_index:end_index]['y'] - self._data_set[current_point]['y']],
+        time_slice = self._timestamps.dtype.type(self.time_slice)
+        self._candidate_starts = np.searchsorted(self._timestamps, self._timestamps - time_slice, side='left')
+        self._candidate_ends = np.searchsorted(self._timestamps, self._timestamps + time_slice, side='right')
+        # number of candidate pairs before every point
+        candidate_offsets = np.hstack([[0], np.cumsum(self._candidate_ends - self._candidate_starts)])
+
+        block_edges = [0]
+        while block_edges[-1] < len(self._data_set):
+            block_pairs = candidate_offsets[block_edges[-1]] + NEIGHBOURHOOD_BATCH_PAIRS
+            block_end = np.searchsorted(candidate_offsets, block_pairs, side='right') - 1
+            block_edges.append(min(max(block_end, block_edges[-1] + 1), len(self._data_set)))
+
+        self._block_edges = np.array(block_edges)
+        self._point_blocks = np.repeat(np.arange(len(block_edges) - 1), np.diff(self._block_edges))
+        self._block_requests = np.zeros(len(block_edges) - 1, dtype=int)
+        self._blocks = dict()
+
+    def _neighbourhoods_are_symmetric(self):
+        """
+        Check whether every point is in the neighbourhood of its neighbours. This is the case unless rounding of the
+        time slice bounds makes a time slice include a point whose time slice does not include the other point.
+
+        :return: boolean value.
+
+        """
+        # the time slices are symmetric if the slice of every point ends where the slices start to exclude it
+        first_excluding = np.searchsorted(self._candidate_starts, np.arange(len(self._data_set)), side='right')
+        return np.array_equal(self._candidate_ends, first_excluding)
+
+    def _compute_neighbourhood_block(self, block):
+        """
+        Compute the neighbourhoods of the points in a block.
+
+        :param block: index of the block, its points are self._block_edges[block] up to self._block_edges[block + 1].
+        :return: tuple of the CSR pointers and indices: the neighbours of the i-th point of the block are
+                 indices[pointers[i]:pointers[i + 1]].
+
+        """
+        block_start = self._block_edges[block]
+        block_end = self._block_edges[block + 1]
+
+        counts = self._candidate_ends[block_start:block_end] - self._candidate_starts[block_start:block_end]
+        points = np.repeat(np.arange(block_start, block_end), counts)
+        # candidates: start index of the point + position in its time slice
+        candidates = np.arange(len(points)) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidates += np.repeat(self._candidate_starts[block_start:block_end], counts)
+
+        distance = np.linalg.norm([self._x[candidates] - self._x[points], self._y[candidates] - self._y[points]],
                                   axis=0)
-        neighbourhood = (np.where(distance <= self.eps_deg)[0] + start_index).tolist()
+        is_neighbour = distance <= self.eps_deg
+        neighbour_counts = np.bincount(points[is_neighbour] - block_start, minlength=block_end - block_start)
+
+        return np.hstack([[0], np.cumsum(neighbour_counts)]), candidates[is_neighbour]
+
+    def _get_neighbourhood(self, current_point):
+        """
+        Get neighbourhood of current point in self._data_set (a 7-column numpy array as data set to be clustered)
+        from the neighbourhood index.
+
+        :param current_point: index of the current core point candidate.
+        :return: index array of the neighbourhood of current point.
+
+        """
+        block = self._point_blocks[current_point]
+        if block not in self._blocks:
+            self._blocks[block] = self._compute_neighbourhood_block(block)
+        pointers, indices = self._blocks[block]
+
+        position = current_point - self._block_edges[block]
+        neighbourhood = indices[pointers[position]:pointers[position + 1]]
+
+        self._block_requests[block] += 1
+        if self._block_requests[block] == self._block_edges[block + 1] - self._block_edges[block]:
+            del self._blocks[block]
 
         return neighbourhood
 
@@ -257,10 +586,10 @@ class DBSCANWithMinPts(DBSCANWithTimeSlice):
         """
         Compare the size of @neighbourhood with @self.min_pts and return boolean value
         as result of validation. True if this is the neighbourhood of a core point, false otherwise.
-        @self._data_set (a 6-column numpy array as data set to be clustered) is used to interpret
-        the @neighbourhood list.
+        @self._data_set (a 7-column numpy array as data set to be clustered) is used to interpret
+        the @neighbourhood array.
 
-        :param neighbourhood: index list as neighbourhood to be validated.
+        :param neighbourhood: index array as neighbourhood to be validated.
         :return: boolean value.
                  True if @neighbourhood contains more than @self.min_pts points, False if not.
 
@@ -268,4 +597,70 @@ class DBSCANWithMinPts(DBSCANWithTimeSlice):
         if len(neighbourhood) >= self.min_pts_abs_value:
             return True
         else:
-            return False
\ No newline at end of file
+            return False
+
+
+class DBSCANWithMinObservers(DBSCANWithTimeSlice):
+    """
+    DBSCAN with time slice that uses MinObservers as neighbourhood validation method
+    (validating that samples of at least @min_observers different observers, i.e. recordings, are present in the
+    neighbourhood before declaring this a core point).
+
+    This method is independent of the frame rate of the gaze position recordings, but is only meaningful when the
+    recordings of several observers that watched the same stimulus are clustered together.
+
+    """
+    def __init__(self, eps_deg=2.0, time_slice_millisec=40, min_observers=2):
+        """
+        Initialize DBSCANWithMinObservers object.
+        :param eps_deg: Spatial Euclidean distance threshold that defines the neighbourhood in the XY-plane.
+                        Given in degrees of visual field.
+        :param time_slice_millisec: Width of the time slice that defines the size of the neighbourhood on the time axis.
+                                    Value is given in milliseconds.
+        :param min_observers: minimum number of observers required to form a "valid" neighbourhood (that of a
+                              core point). An integer, or a float between 0 and 1 that is the fraction of the
+                              clustered recordings, in which case the actual value is determined during the
+                              self._setup_internal_parameters() call
+        """
+        super(DBSCANWithMinObservers, self).__init__(eps_deg=eps_deg, time_slice_millisec=time_slice_millisec)
+
+        self.min_observers = min_observers
+        if type(self.min_observers) == int:
+            self.min_observers_abs_value = self.min_observers
+
+    def required_observers(self, observers):
+        """
+        Minimal number of observers of a valid neighbourhood when @observers recordings are clustered together.
+        :param observers: number of recordings that are clustered together.
+        :return: min_observers, or the number of observers for its fraction of @observers.
+
+        """
+        if type(self.min_observers) == float:
+            return int(math.ceil(self.min_observers * observers))
+        return self.min_observers
+
+    def _setup_internal_parameters(self, gaze_points_list):
+        """
+        If min_observers was a fraction, set it accordingly here
+        :param gaze_points_list: a list of arff objects (dictionary with fields such as 'data' and 'metadata')
+
+        """
+        self.min_observers_abs_value = self.required_observers(len(gaze_points_list))
+
+    def _validate_neighbourhood(self, neighbourhood):
+        """
+        Count the observers in @neighbourhood, compare with @self.min_observers and return boolean value
+        as result of validation. True if this is the neighbourhood of a core point, false otherwise.
+        @self._data_set (a 7-column numpy array as data set to be clustered) is used to interpret
+        the @neighbourhood array.
+
+        :param neighbourhood: index array as neighbourhood to be validated.
+        :return: boolean value.
+                 True if @neighbourhood contains samples of at least @self.min_observers observers, False if not.
+
+        """
+        observers = np.unique(self._data_set['observer_id'][neighbourhood])
+        if len(observers) >= self.min_observers_abs_value:
+            return True
+        else:
+            return False